@@ -0,0 +1,161 @@
+"""Benchmarks of the mp=True transports and of the thread pool
+
+transport: runs the same workloads with ``transport="manager"`` and
+``transport="queue"``, and reports the time until every message has been
+applied by the accountant:
+
+- chatty: each process sends ``--events`` info events, which the buffered
+  reporter merges into a few queue puts.
+- subtasks: each process runs ``--items`` subtasks; every ``done`` flushes,
+  so each subtask costs a few queue puts.
+
+threadpool: maps ``--jobs`` SHA-256 hashes of 1 MB buffers (which release
+the GIL) over a ``--threads`` thread pool, next to the same map on a
+``concurrent.futures.ThreadPoolExecutor`` and serially, and reports the CPU
+time used by the idle pool over one second.
+
+Usage: python benchmark.py [--only transport|threadpool] [--processes 32]
+    [--events 1000] [--items 2000] [--threads 8] [--jobs 2000]
+"""
+
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from syllabus import Task
+from syllabus.parallel.threadpool import Pool
+
+
+def chatty(task, n):
+    """Send n events"""
+    task.start()
+    for i in range(n):
+        task.info("event {i}".format(i=i))
+    task.done()
+
+
+def subtasks(task, n):
+    """Run n subtasks"""
+    task.start()
+    for i in range(n):
+        task.subtask(name="item").start().done()
+    task.done()
+
+
+def run(transport, target, processes, n):
+    """Time a workload
+
+    Returns
+    -------
+    float
+        Seconds from starting the processes until their messages have been
+        applied
+    """
+
+    main = Task("Benchmark", mp=True, transport=transport).start()
+    procs = [
+        multiprocessing.Process(
+            target=target, args=(main.subtask(name="worker"), n))
+        for _ in range(processes)]
+
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    main.metadata(nowait=False)
+    elapsed = time.perf_counter() - start
+
+    main.done()
+    return elapsed
+
+
+def digest(buf, task=None):
+    """Hash a buffer; hashlib releases the GIL for large buffers"""
+    return hashlib.sha256(buf).digest()
+
+
+def run_pool(mode, threads, jobs):
+    """Time a map of ``digest`` over ``jobs`` buffers
+
+    Returns
+    -------
+    float
+        Seconds taken by the map
+    """
+
+    bufs = [bytes(2**20)] * jobs
+    if mode == "syllabus":
+        main = Task("Benchmark").start()
+        pool = Pool(threads=threads)
+        start = time.perf_counter()
+        pool.map(digest, bufs, task=main, name="digest")
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        main.done()
+    elif mode == "executor":
+        with ThreadPoolExecutor(threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(digest, bufs))
+            elapsed = time.perf_counter() - start
+    else:
+        start = time.perf_counter()
+        for buf in bufs:
+            digest(buf)
+        elapsed = time.perf_counter() - start
+    return elapsed
+
+
+def idle_cpu(threads):
+    """CPU time used by an idle pool over one second"""
+    pool = Pool(threads=threads)
+    start = time.process_time()
+    time.sleep(1)
+    used = time.process_time() - start
+    pool.shutdown()
+    return used
+
+
+def report(name, times):
+    """Print the best and median times of a benchmark"""
+    print("{w:<22} best {b:.3f}s  median {m:.3f}s".format(
+        w=name, b=min(times), m=sorted(times)[len(times) // 2]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--only", choices=["transport", "threadpool"],
+        help="only run one benchmark")
+    parser.add_argument("--processes", type=int, default=32)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    benchmarks = (
+        ["transport", "threadpool"] if args.only is None else [args.only])
+
+    if "transport" in benchmarks:
+        workloads = [
+            ("chatty", chatty, args.events),
+            ("subtasks", subtasks, args.items)]
+        for name, target, n in workloads:
+            for transport in ["manager", "queue"]:
+                report(
+                    "{w} {t}".format(w=name, t=transport),
+                    [run(transport, target, args.processes, n)
+                     for _ in range(args.repeat)])
+
+    if "threadpool" in benchmarks:
+        for mode in ["syllabus", "executor", "serial"]:
+            report(
+                "threadpool {m}".format(m=mode),
+                [run_pool(mode, args.threads, args.jobs)
+                 for _ in range(args.repeat)])
+        print("threadpool idle cpu    {c:.3f}s per second".format(
+            c=idle_cpu(args.threads)))
@@ -13,6 +13,7 @@ setup(
         'syllabus.format',
         'syllabus.app_utils',
         'syllabus.parallel',
+        'syllabus.profiling',
         'syllabus.reporting'
     ],
     install_requires=['printtools', 'ansiwrap'],
@@ -1,4 +1,8 @@
 from .getch import getch
 from .blocks import header, footer, pad, span, wrap
+from .render import Renderer, LineCache
+from .viewport import Viewport
 
-__all__ = ["getch", "header", "footer", "pad", "span", "wrap"]
+__all__ = [
+    "getch", "header", "footer", "pad", "span", "wrap",
+    "Renderer", "LineCache", "Viewport"]
@@ -0,0 +1,145 @@
+"""Diff-based terminal rendering
+
+Attributes
+----------
+CLEAR : str
+    ANSI sequence to clear the screen and move the cursor to the top left
+"""
+
+import sys
+from collections import OrderedDict
+from shutil import get_terminal_size
+
+from .blocks import wrap
+
+
+CLEAR = '\x1B[2J\x1B[H'
+
+
+class Renderer:
+    """Terminal renderer that only rewrites lines that changed
+
+    Keeps the previously drawn frame; each line of a new frame is compared
+    with the line drawn at the same row, and only changed rows are rewritten
+    using ANSI cursor positioning. The screen is fully cleared only when the
+    terminal is resized.
+
+    Parameters
+    ----------
+    stream : file-like or None
+        Output stream; if None, sys.stdout is used.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = sys.stdout if stream is None else stream
+        self.__frame = []
+        self.__size = None
+
+    def reset(self):
+        """Force a full redraw on the next frame"""
+        self.__frame = []
+        self.__size = None
+
+    def draw(self, rows):
+        """Draw frame
+
+        Parameters
+        ----------
+        rows : str[]
+            Frame contents; each row should fit on a single terminal line,
+            and there should be no more rows than the terminal height.
+
+        Returns
+        -------
+        int
+            Number of rows rewritten
+        """
+
+        out = []
+
+        size = get_terminal_size()
+        if size != self.__size:
+            out.append(CLEAR)
+            self.__frame = []
+            self.__size = size
+
+        changed = 0
+        for i, row in enumerate(rows):
+            if i >= len(self.__frame) or self.__frame[i] != row:
+                out.append('\x1B[{r};1H{row}\x1B[0m\x1B[K'.format(
+                    r=i + 1, row=row))
+                changed += 1
+        if len(rows) < len(self.__frame):
+            out.append('\x1B[{r};1H\x1B[J'.format(r=len(rows) + 1))
+
+        self.__frame = list(rows)
+
+        if out:
+            out.append('\x1B[{r};1H'.format(r=len(rows) + 1))
+            self.stream.write(''.join(out))
+            self.stream.flush()
+
+        return changed
+
+
+class LineCache:
+    """Cache of formatted and wrapped tree lines
+
+    Lines for finished tasks and events never change, so their wrapped rows
+    are cached per line object and terminal width (least recently used lines
+    are dropped first). Lines for tasks in progress contain a spinner and a
+    timer, and are formatted on every call.
+
+    Parameters
+    ----------
+    fmt : (int, dict) -> str
+        Line formatter
+    size : int
+        Maximum number of cached lines
+    """
+
+    def __init__(self, fmt, size=65536):
+        self.fmt = fmt
+        self.size = size
+        self.__cache = OrderedDict()
+
+    @staticmethod
+    def dynamic(line):
+        """Check if a line changes over time (task in progress)"""
+        d = line[1]
+        return (
+            'id' in d and
+            d['start_time'] is not None and
+            d['end_time'] is None)
+
+    def rows(self, line, width):
+        """Get formatted and wrapped rows for a line
+
+        Parameters
+        ----------
+        line : (int, dict)
+            Line, as generated by OrderedTree
+        width : int
+            Terminal width
+
+        Returns
+        -------
+        str[]
+            Wrapped rows
+        """
+
+        if self.dynamic(line):
+            return wrap(self.fmt(line), width)
+
+        key = id(line)
+        cached = self.__cache.get(key)
+        if cached is not None and cached[0] is line and cached[1] == width:
+            self.__cache.move_to_end(key)
+            return cached[2]
+
+        rows = wrap(self.fmt(line), width)
+        self.__cache[key] = (line, width, rows)
+        self.__cache.move_to_end(key)
+        if len(self.__cache) > self.size:
+            self.__cache.popitem(last=False)
+        return rows
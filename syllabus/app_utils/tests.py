@@ -0,0 +1,168 @@
+"""Unit Tests for Terminal Rendering"""
+
+import os
+import re
+import unittest
+from io import StringIO
+from unittest import mock
+
+from . import render
+from .render import Renderer, LineCache, CLEAR
+from .viewport import Viewport
+
+
+# Row writes: cursor moved to the start of a row, then the row contents
+ROW = re.compile(r'\x1B\[(\d+);1H(.*?)\x1B\[0m\x1B\[K')
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        size = mock.patch.object(
+            render, "get_terminal_size",
+            return_value=os.terminal_size((80, 24)))
+        size.start()
+        self.addCleanup(size.stop)
+
+    def draw(self, renderer, stream, rows):
+        """Draw a frame, and return the output of the frame"""
+        stream.seek(0)
+        stream.truncate()
+        renderer.draw(rows)
+        return stream.getvalue()
+
+    def test_renderer(self):
+
+        stream = StringIO()
+        renderer = Renderer(stream=stream)
+
+        # First frame clears the screen and writes every row
+        out = self.draw(renderer, stream, ["a", "b", "c"])
+        self.assertTrue(out.startswith(CLEAR))
+        self.assertEqual(
+            ROW.findall(out), [("1", "a"), ("2", "b"), ("3", "c")])
+
+        # Unchanged frame: nothing is written
+        self.assertEqual(self.draw(renderer, stream, ["a", "b", "c"]), "")
+
+        # Only changed rows are rewritten
+        out = self.draw(renderer, stream, ["a", "B", "c", "d"])
+        self.assertNotIn(CLEAR, out)
+        self.assertEqual(ROW.findall(out), [("2", "B"), ("4", "d")])
+
+        # Shrinking clears the rows below the new frame
+        out = self.draw(renderer, stream, ["a", "B"])
+        self.assertEqual(ROW.findall(out), [])
+        self.assertIn('\x1B[3;1H\x1B[J', out)
+        self.assertEqual(self.draw(renderer, stream, ["a", "B"]), "")
+
+        # Resizing, or reset, redraws everything
+        render.get_terminal_size.return_value = os.terminal_size((100, 24))
+        out = self.draw(renderer, stream, ["a", "B"])
+        self.assertTrue(out.startswith(CLEAR))
+        self.assertEqual(ROW.findall(out), [("1", "a"), ("2", "B")])
+        renderer.reset()
+        self.assertEqual(
+            ROW.findall(self.draw(renderer, stream, ["a", "B"])),
+            [("1", "a"), ("2", "B")])
+
+    def test_line_cache(self):
+
+        calls = []
+
+        def fmt(line):
+            calls.append(line)
+            return line[1]["text"]
+
+        cache = LineCache(fmt, size=2)
+        done = (0, {"id": "a", "start_time": 1, "end_time": 2, "text": "x"})
+        running = (
+            0, {"id": "b", "start_time": 1, "end_time": None, "text": "y"})
+        event = (1, {"text": "z" * 30})
+
+        # Finished lines are formatted once per width
+        rows = cache.rows(done, 80)
+        self.assertIs(cache.rows(done, 80), rows)
+        self.assertEqual(len(calls), 1)
+        cache.rows(done, 40)
+        self.assertEqual(len(calls), 2)
+
+        # Lines in progress are formatted every time
+        cache.rows(running, 80)
+        cache.rows(running, 80)
+        self.assertEqual(len(calls), 4)
+
+        # Long lines are wrapped; least recently used lines are dropped
+        self.assertEqual(len(cache.rows(event, 10)), 3)
+        cache.rows(done, 40)
+        cache.rows(event, 10)
+        self.assertEqual(len(calls), 5)
+        cache.rows((0, dict(done[1])), 40)
+        cache.rows(done, 40)
+        self.assertEqual(len(calls), 7)
+
+    def test_viewport(self):
+
+        wrapped = []
+
+        def rows(line, width):
+            wrapped.append(line)
+            return ["  {i}.{j}".format(i=line[0], j=j) for j in range(line[1])]
+
+        def render(lines, height=5):
+            del wrapped[:]
+            return view.render(lines, height, 80)
+
+        view = Viewport(rows, marker=" >")
+        lines = [(i, 1) for i in range(10**6)]
+
+        # Only the visible slice is wrapped
+        self.assertEqual(
+            render(lines), [" >0.0", "  1.0", "  2.0", "  3.0", "  4.0"])
+        self.assertEqual(set(wrapped), set(lines[:5]))
+
+        # The screen scrolls down to follow the cursor
+        view.move(10)
+        self.assertEqual(
+            render(lines), ["  6.0", "  7.0", "  8.0", "  9.0", " >10.0"])
+        self.assertEqual(view.top, 6)
+        self.assertLess(len(wrapped), 20)
+
+        # Clamped at the top...
+        view.move(-100)
+        self.assertEqual(render(lines)[0], " >0.0")
+        self.assertEqual((view.cursor, view.top), (0, 0))
+
+        # ...and at the bottom, without empty rows below the last line
+        view.jump(10**6 - 2)
+        self.assertEqual(
+            render(lines),
+            ["  999995.0", "  999996.0", "  999997.0", " >999998.0",
+             "  999999.0"])
+        self.assertEqual(view.top, 10**6 - 5)
+        self.assertLess(len(wrapped), 20)
+        view.move(100)
+        render(lines)
+        self.assertEqual(view.cursor, 10**6 - 1)
+        view.jump(-1)
+        self.assertEqual(render(lines)[-1], " >999999.0")
+
+        # Sticky cursor follows new lines
+        view.sticky = True
+        lines.append((10**6, 1))
+        self.assertEqual(render(lines)[-1], " >1000000.0")
+
+        # Wrapped lines: the screen starts at the cursor if the lines above
+        # do not fit, and rows past the bottom are cut
+        view = Viewport(rows, marker=" >")
+        lines = [(i, 3) for i in range(10)]
+        view.move(4)
+        self.assertEqual(
+            render(lines), [" >4.0", "  4.1", "  4.2", "  5.0", "  5.1"])
+        self.assertEqual(view.top, 4)
+
+        # Fewer lines than rows: padded with empty rows
+        view = Viewport(rows, marker=" >")
+        self.assertEqual(
+            render([(0, 1), (1, 2)]), [" >0.0", "  1.0", "  1.1", "", ""])
+        self.assertEqual(render([]), [""] * 5)
@@ -0,0 +1,132 @@
+"""Scrollable window over wrapped lines"""
+
+
+class Viewport:
+    """Window of lines shown on screen, following a cursor
+
+    Lines may wrap over several rows. Only the lines in the window (and,
+    when the window scrolls, the lines between the cursor and the edge of
+    the screen) are wrapped, so drawing a frame does not depend on the
+    number of lines.
+
+    Parameters
+    ----------
+    rows : (line, int) -> str[]
+        Wrapped rows of a line for a terminal width (such as
+        ``LineCache.rows``)
+    marker : str
+        Replaces the start of the first row of the cursor line
+
+    Attributes
+    ----------
+    cursor : int
+        Index of the selected line; -1 selects the last line
+    top : int
+        Index of the first line on screen
+    sticky : bool
+        If True, the cursor stays on the last line
+    """
+
+    def __init__(self, rows, marker=' >'):
+        self.rows = rows
+        self.marker = marker
+        self.cursor = 0
+        self.top = 0
+        self.sticky = False
+
+    def move(self, n):
+        """Move the cursor by n lines; the screen follows the cursor"""
+        self.cursor = max(0, self.cursor + n)
+
+    def jump(self, idx):
+        """Move the cursor to a line, shown at the top of the screen
+
+        Parameters
+        ----------
+        idx : int
+            Line index; -1 moves the cursor to the last line
+        """
+        self.cursor = idx
+        if idx >= 0:
+            self.top = idx
+
+    def render(self, lines, height, width):
+        """Get the rows on screen
+
+        Parameters
+        ----------
+        lines : list
+            Lines (passed to ``rows``)
+        height : int
+            Screen height, in rows
+        width : int
+            Screen width, used for wrapping
+
+        Returns
+        -------
+        str[]
+            Exactly ``height`` rows; rows below the last line are empty
+        """
+
+        if not lines:
+            self.cursor = self.top = 0
+            return [''] * height
+
+        # Cursor = -1 (jump to bottom) or cursor greater than allowed or
+        # sticky bottom enabled => set to greatest allowed
+        if self.cursor < 0 or self.cursor >= len(lines) or self.sticky:
+            self.cursor = max(0, len(lines) - 1)
+
+        # Keep the cursor on screen: scroll up to it, or scroll down until
+        # the lines from the top to the cursor fit
+        if self.top > self.cursor or self.top < 0:
+            self.top = self.cursor
+        else:
+            self.top = max(
+                self.top, self.__first(lines, self.cursor, height, width))
+
+        # Never leave empty space below the last line
+        if self.top > 0:
+            self.top = min(
+                self.top, self.__first(lines, len(lines) - 1, height, width))
+
+        # Wrap lines in the viewport
+        body = []
+        idx = self.top
+        while len(body) < height and idx < len(lines):
+            rows = self.rows(lines[idx], width)
+            if idx == self.cursor:
+                rows = [self.marker + rows[0][len(self.marker):]] + rows[1:]
+            body += rows
+            idx += 1
+        body = body[:height]
+        return body + [''] * (height - len(body))
+
+    def __first(self, lines, bottom, height, width):
+        """Get the first line index of a screen ending at a given line
+
+        Parameters
+        ----------
+        lines : list
+            Lines
+        bottom : int
+            Index of the last line to show
+        height : int
+            Screen height, in rows
+        width : int
+            Screen width, used for wrapping
+
+        Returns
+        -------
+        int
+            Smallest index such that lines [index, bottom] fit on screen
+        """
+
+        rows = 0
+        idx = bottom
+        while idx >= 0:
+            rows += len(self.rows(lines[idx], width))
+            if rows > height:
+                return min(idx + 1, bottom)
+            idx -= 1
+        return 0
@@ -5,15 +5,21 @@ import threading
 import os
 import time
 import print as p
+from shutil import get_terminal_size
 
 from .task import Task
 from .format import format_line
-from .reporting import ordered_tree
+from .reporting import OrderedTree
+from .app_utils import Renderer, LineCache
 
 
 class BasicTaskApp(Task):
     """Basic Task App without interactive features
 
+    While the task is running, the bottom of the task tree is shown; only
+    rows that changed since the previous frame are redrawn. Once the task is
+    done, the full tree is printed.
+
     Parameters
     ----------
     refresh_rate : float
@@ -26,6 +32,11 @@ class BasicTaskApp(Task):
 
         self.__log_idx = 0
         self.__refresh_rate = refresh_rate
+        self.__order = OrderedTree()
+        self.__renderer = Renderer()
+        self.__line_cache = LineCache(format_line)
+        self.__version = None
+        self.__lines = []
 
         self.__app_thread = threading.Thread(target=self.__app_update)
         self.__app_thread.start()
@@ -33,6 +44,29 @@ class BasicTaskApp(Task):
     def draw(self):
         """Draw screen"""
 
+        # Tree only needs to be re-ordered if the accountant has applied
+        # updates since the last frame
+        version = self.accountant.version
+        if version != self.__version:
+            self.__version = version
+            self.__lines = self.__order.update(self.metadata())
+
+        size = get_terminal_size()
+        height = max(1, size.lines - 1)
+
+        # Only the bottom of the tree (the part that fits on screen) is
+        # formatted and wrapped
+        rows = []
+        for line in reversed(self.__lines):
+            rows += reversed(self.__line_cache.rows(line, size.columns - 1))
+            if len(rows) >= height:
+                break
+
+        self.__renderer.draw(rows[:height][::-1])
+
+    def draw_final(self):
+        """Clear screen and print the full tree"""
+
         os.system('cls' if os.name == 'nt' else 'clear')
         p.print(self.render_tree())
 
@@ -42,11 +76,11 @@ class BasicTaskApp(Task):
         while threading.main_thread().is_alive() and self.end_time is None:
             self.draw()
             time.sleep(1 / self.__refresh_rate)
-        self.draw()
+        self.draw_final()
 
     def render_tree(self):
         """Render task tree"""
 
         return '\n'.join([
             format_line(line)
-            for line in ordered_tree(self.metadata())])
+            for line in self.__order.update(self.metadata())])
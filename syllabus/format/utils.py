@@ -61,6 +61,62 @@ def format_not_started(d):
     return p.render('[ ][0%]', p.BOLD)
 
 
+def _size_str(s, sign=False):
+    """Format a (possibly negative) size in bytes"""
+    val, units = size_fmt(abs(s))
+    if units == 'NULL':
+        val, units = 0, 'B'
+    return '{s}{v:.2f}{u}'.format(
+        s=('-' if s < 0 else '+') if sign else '', v=val, u=units)
+
+
+def _time_str(t):
+    """Format a time in seconds"""
+    val, units = time_fmt(t) if t > 0 else (0, 's')
+    return '{t:.2f}{u}'.format(t=val, u=units)
+
+
+def format_usage(d):
+    """Format resource usage of a task (see ``profiling.Usage``), or the
+    latest resource sample if the task has no usage
+
+    Returns
+    -------
+    str
+        Usage summary, such as
+        '[rss 1.20GB +300.00MB | peak 1.50GB | cpu 2.10s usr 0.30s sys]';
+        empty if neither is available
+    """
+
+    usage = d.get("usage")
+    if usage:
+        info = []
+        if usage.get("rss") is not None:
+            rss = "rss " + _size_str(usage["rss"])
+            if usage.get("rss_delta") is not None:
+                rss += " " + _size_str(usage["rss_delta"], sign=True)
+            info.append(rss)
+        if usage.get("max_rss") is not None:
+            info.append("peak " + _size_str(usage["max_rss"]))
+        if usage.get("tracemalloc_peak") is not None:
+            info.append("traced " + _size_str(usage["tracemalloc_peak"]))
+        info.append("cpu {u} usr {s} sys".format(
+            u=_time_str(usage["cpu_user"]), s=_time_str(usage["cpu_system"])))
+        return "[" + " | ".join(info) + "]"
+
+    sample = d.get("sample")
+    if sample:
+        info = []
+        if sample.get("rss") is not None:
+            info.append("rss " + _size_str(sample["rss"]))
+        info.append("cpu {u} usr {s} sys".format(
+            u=_time_str(sample["cpu_user"]),
+            s=_time_str(sample["cpu_system"])))
+        return "[" + " | ".join(info) + "]"
+
+    return ""
+
+
 def format_line(line):
     """Convert line to string
 
@@ -92,6 +148,13 @@ def format_line(line):
         ret += ' ' + str(d["name"])
         if d["desc"] is not None:
             ret += " : " + str(d["desc"])
+        usage = format_usage(d)
+        if usage:
+            ret += " " + usage
+        if d.get("dropped"):
+            ret += " " + p.render(
+                "({n} events dropped)".format(n=sum(d["dropped"].values())),
+                p.BR + p.BLACK)
 
     # Message
     else:
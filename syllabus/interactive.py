@@ -4,19 +4,14 @@
 import threading
 import time
 
-# Output
-import os
-import print as p
-
 # Output Formatting
 from shutil import get_terminal_size
-import re
 
 # Dependencies
 from .task import Task
 from .format import format_line
-from .reporting import ordered_tree
-from .app_utils import getch, header, footer, wrap
+from .reporting import OrderedTree
+from .app_utils import getch, header, footer, Renderer, LineCache, Viewport
 
 
 class InteractiveTaskApp(Task):
@@ -35,10 +30,14 @@ class InteractiveTaskApp(Task):
 
         super().__init__(*args, **kwargs)
 
-        self.__log_idx = 0
-        self.__cursor = 0
-        self.__stuck_to_bottom = False
         self.__refresh_rate = refresh_rate
+        self.__order = OrderedTree()
+        self.__renderer = Renderer()
+        self.__line_cache = LineCache(self.__format_line)
+        self.__viewport = Viewport(
+            self.__line_cache.rows, marker=self.__CURSOR)
+        self.__version = None
+        self.__lines = []
 
         self.__app_thread = threading.Thread(target=self.__app_update)
         self.__app_thread.start()
@@ -47,51 +46,25 @@ class InteractiveTaskApp(Task):
         self.__kb_thread.start()
 
     def draw(self):
-        """Draw terminal app"""
+        """Draw terminal app
+
+        Only the lines on screen are formatted and wrapped (see
+        ``Viewport``).
+        """
 
         height = get_terminal_size().lines - 3
         width = get_terminal_size().columns
 
-        # Text wrap
-        content = []
-        for line in self.render_tree().split('\n'):
-            content += wrap(line, width)
-
-        # Compute and update index
-        max_log_idx = max(0, len(content) - height + 2)
-
-        # Index = -1 (jump to bottom) or index greater than allowed or
-        # sticky bottom enabled => set to greatest allowed
-        if (
-                self.__log_idx < 0 or
-                self.__log_idx > max_log_idx or
-                self.__stuck_to_bottom):
-            self.__log_idx = max_log_idx
-        # Cursor = -1 (jump to bottom) or cursor greater than allowed or
-        # sticky bottom enabled => set to greatest allowed
-        if (
-                self.__cursor == -1 or
-                self.__cursor >= len(content) or
-                self.__stuck_to_bottom):
-            self.__cursor = max(0, len(content) - 1)
-            self.__log_idx = max_log_idx
-
-        # Draw cursor
-        content[self.__cursor] = self.__CURSOR + content[self.__cursor][2:]
-
-        # Assemble contents
-        body_len = len(content)
-        body = '\n'.join(content[self.__log_idx: self.__log_idx + height])
-
-        if body_len - self.__log_idx < height:
-            body += '\n' * (height - body_len + self.__log_idx)
-
-        body = header() + body + '\n' + footer()
-
-        # Print output
-        os.system('cls' if os.name == 'nt' else 'clear')
-        body = re.sub('\n', '\r\n', body)
-        p.print(body)
+        # Tree only needs to be re-ordered if the accountant has applied
+        # updates since the last frame
+        version = self.accountant.version
+        if version != self.__version:
+            self.__version = version
+            self.__lines = self.__order.update(self.metadata())
+
+        # Print output; only changed rows are redrawn
+        body = self.__viewport.render(self.__lines, height, width)
+        self.__renderer.draw([header()] + body + [footer()])
 
     def __app_update(self):
         """App update loop"""
@@ -101,30 +74,6 @@ class InteractiveTaskApp(Task):
             time.sleep(1 / self.__refresh_rate)
         self.draw()
 
-    def __set_log_idx(self, new, relative=True):
-        """Set current index
-
-        Parameters
-        ----------
-        new : int
-            New index
-        relative : bool
-            if True, new is added to the current; if False, the index is
-            overwritten
-        """
-
-        # Index
-        if relative:
-            if (
-                    (self.__log_idx != 0 or new >= 0) and
-                    self.__cursor - self.__log_idx == 2):
-                self.__log_idx += new
-            if self.__cursor != 0 or new >= 0:
-                self.__cursor += new
-        else:
-            self.__log_idx = new
-            self.__cursor = new
-
     def __kb_update(self):
         """Keyboard update loop"""
 
@@ -139,21 +88,25 @@ class InteractiveTaskApp(Task):
                     ch = None
 
             if ch == 'w':
-                self.__stuck_to_bottom = False
-                self.__set_log_idx(-1)
+                self.__viewport.sticky = False
+                self.__viewport.move(-1)
             elif ch == 'W':
-                self.__stuck_to_bottom = False
-                self.__set_log_idx(0, relative=False)
+                self.__viewport.sticky = False
+                self.__viewport.jump(0)
             elif ch == 's':
-                self.__set_log_idx(1)
+                self.__viewport.move(1)
             elif ch == 'S':
-                self.__stuck_to_bottom = True
-                self.__set_log_idx(-1, relative=False)
+                self.__viewport.sticky = True
+                self.__viewport.jump(-1)
             elif ch == ' ':
                 pass
 
             time.sleep(0.05)
 
+    def __format_line(self, line):
+        """Format line, with space for the cursor"""
+        return self.__NOCURSOR + format_line(line)
+
     def render_tree(self):
         """Render task tree
 
@@ -164,5 +117,5 @@ class InteractiveTaskApp(Task):
         """
 
         return '\n'.join([
-            self.__NOCURSOR + format_line(line)
-            for idx, line in enumerate(ordered_tree(self.metadata()))])
+            self.__format_line(line)
+            for line in self.__order.update(self.metadata())])
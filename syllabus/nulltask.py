@@ -4,7 +4,7 @@ Has all the same function calls, but no actual functionality; use to disable
 task tracking
 """
 
-from .parallel import ParallelMixin
+from .parallel import ParallelMixin, PoolManager
 
 
 class NullTask(ParallelMixin):
@@ -16,7 +16,10 @@ class NullTask(ParallelMixin):
 
     # Reporter mixins
     def __init__(
-            self, name='Task', desc=None, root=True, reporter=None, mp=False):
+            self, name='Task', desc=None, root=True, reporter=None, mp=False,
+            log=None, profile=False, sample_interval=None, max_events=None,
+            pinned=("error", "warning"), spill=None, transport="manager",
+            asynchronous=False, sampler=None):
 
         # Zeroed values
         self.name = "A Null task object"
@@ -25,6 +28,8 @@ class NullTask(ParallelMixin):
         self.start_time = None
         self.end_time = None
         self.size = 0
+        self.profile = False
+        self.usage = None
         self.children = {}
         self.id = ""
         self.events = []
@@ -33,6 +38,7 @@ class NullTask(ParallelMixin):
 
         # MP flag -- is used since subtask and pool still work
         self.mp = mp
+        self.pools = PoolManager()
 
     def update_metadata(self, *keys):
         pass
@@ -67,6 +73,9 @@ class NullTask(ParallelMixin):
     def add_tasks(self, n):
         pass
 
+    def add_task(self, n):
+        pass
+
     def add_progress(self, n):
         pass
 
@@ -80,7 +89,7 @@ class NullTask(ParallelMixin):
     def save(self, file, pretty=True):
         pass
 
-    def metadata(self, root=None, nowait=True, previous=True):
+    def metadata(self, root=None, nowait=True):
         return {}
 
     # Main class methods
@@ -88,10 +97,23 @@ class NullTask(ParallelMixin):
         return self
 
     def done(self, *objects, name=None, desc=None, nowait=False):
+        self.pools.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.done()
+        return False
+
+    def attach_loop(self, loop=None):
         pass
 
     def subtask(self, name='Child Task', desc=None):
         return NullTask()
 
+    def handle(self):
+        return self
+
     def __str__(self):
         return "Null Task object (is task tracking disabled?)"
@@ -1,3 +1,9 @@
 from .parallel_mixins import ParallelMixin
+from .pools import PoolManager
+from .threadpool import JobError
+from .schedule import Scheduler, LargestFirst, runtime_stats
+from .shared import SharedArray
 
-__all__ = ["ParallelMixin"]
+__all__ = [
+    "ParallelMixin", "PoolManager", "JobError",
+    "Scheduler", "LargestFirst", "runtime_stats", "SharedArray"]
@@ -1,12 +1,96 @@
 
 """Task-wrapped map-reduce implementations"""
 
-from .threadpool import Pool as ThreadPool
-from multiprocessing import Pool as ProcPool
+import time
+import queue
+import asyncio
+import traceback
+from threading import Lock
+from itertools import islice
+from functools import partial
+from collections import deque
+
+from .threadpool import Pool as ThreadPool, AsyncJob, JobError, current_pool
+from .pools import PoolManager
+from .schedule import runtime_stats, timed_call
+from .shared import write_out
+from ..format import time_fmt
+from ..reporting.buffer import drain_local
 from multiprocessing import cpu_count
 
 
+# Largest chunk size picked by imap's chunk size tuning
+MAX_CHUNKSIZE = 4096
+
+
+def _run_chunk(target, chunk):
+    """Run a target on a chunk of arguments in a worker process
+
+    Returns
+    -------
+    (list, float)
+        Results, and time spent computing them, in seconds
+    """
+    start = time.perf_counter()
+    results = [target(arg) for arg in chunk]
+    return results, time.perf_counter() - start
+
+
+def _run_with_handle(target, item):
+    """Run a process pool target whose task is a ``Task.handle``
+
+    Exceptions are caught and reported as an error event on the task, so
+    that the messages of every job in a map reach the parent, even if some
+    of them fail.
+
+    Parameters
+    ----------
+    target : [arg, task] -> result
+        Process pool target
+    item : [arg, task]
+        Target argument and task handle
+
+    Returns
+    -------
+    (arbitrary type, dict[], (str, Exception, str) or None)
+        Result (None if the job failed), the messages reported by task
+        handles during the job, and the failing task's ID, the exception,
+        and its formatted traceback (if the job failed)
+    """
+    drain_local()
+    try:
+        result = target(item)
+    except Exception as e:
+        task = item[1]
+        task.error("{n}: {e}".format(n=type(e).__name__, e=e))
+        return None, drain_local(), (task.id, e, traceback.format_exc())
+    return result, drain_local(), None
+
+
+def _reduce_chunk(reducer, chunk, task=None):
+    """Run a thread pool reducer on a chunk of results
+
+    Reducers only take the results (``reducer(chunk)``); the subtask created
+    by the pool for the call tracks it instead.
+    """
+    task.start(desc="Reducing {n} results".format(n=len(chunk)))
+    result = reducer(chunk)
+    task.done()
+    return result
+
+
 class ParallelMixin:
+    """Parallel Map-Reduce Mixin for Task Class
+
+    Parameters
+    ----------
+    pools : PoolManager or None
+        Worker pools shared with the parent task; if None (root task), a new
+        PoolManager is created.
+    """
+
+    def __init__(self, pools=None):
+        self.pools = PoolManager() if pools is None else pools
 
     def pool(self, *args, process=False, **kwargs):
         """Run Map-Reduce pool
@@ -18,18 +102,221 @@ class ParallelMixin:
         """
 
         if process:
-            if not self.mp:
-                raise Exception(
-                    "Task does not have multiprocessing enabled. The parent"
-                    " task must have mp=True.")
             return self.__proc_pool(*args, **kwargs)
         else:
             return self.__thread_pool(*args, **kwargs)
 
+    def imap(
+            self, target, args, shared_args=None, shared_init=None,
+            ordered=True, chunksize=None, window=None,
+            name='Process Map', cores=None, chunk_time=0.1):
+        """Lazily map over an iterable in the process pool
+
+        Arguments are consumed from ``args`` only as workers free up: at most
+        ``window`` chunks are in flight at a time, so arbitrarily long
+        generators are mapped in constant memory. Progress is tracked by a
+        single subtask (instead of one subtask per argument), which is marked
+        done when iteration ends, even if the caller stops early or a job
+        fails.
+
+        Parameters
+        ----------
+        target : arg -> result
+            Function to run on each argument; must be picklable. Unlike
+            ``pool``, no task is passed.
+        args : iterable
+            Arguments (arbitrary type); can be a generator.
+        shared_args : [arbitrary type]
+            Shared arguments to pass to each process; NumPy arrays are passed
+            through shared memory (see ``PoolManager.share``).
+        shared_init : shared_args -> void
+            Set globals in order to handle shared arg inheritance
+        ordered : bool
+            If True, results are yielded in the order of ``args``; otherwise,
+            results are yielded as chunks complete.
+        chunksize : int or None
+            Number of arguments sent to a worker at a time. If None, the chunk
+            size is tuned from the measured time per argument so that each
+            chunk takes about ``chunk_time`` seconds.
+        window : int or None
+            Maximum number of chunks in flight; defaults to twice the number
+            of processes.
+        name : str
+            Name of the tracking subtask
+        cores : int
+            Number of processes to use
+        chunk_time : float
+            Target time per chunk, in seconds, for chunk size tuning
+
+        Yields
+        ------
+        arbitrary type
+            Results of ``target``
+        """
+
+        if shared_args is not None and shared_init is not None:
+            p = self.pools.process_pool(
+                cores=cores, initializer=shared_init, initargs=shared_args)
+        else:
+            p = self.pools.process_pool(cores=cores)
+        if window is None:
+            window = 2 * (cpu_count() if cores is None else cores)
+
+        task = self.subtask(name=name).start(desc="Mapping...")
+        args = iter(args)
+        size = 1 if chunksize is None else chunksize
+        per_item = None
+        n_done = 0
+
+        # Ordered: AsyncResults in submission order. Unordered: completed
+        # chunks (or exceptions) are pushed to a queue by the pool callbacks.
+        inflight = deque()
+        completed = queue.Queue()
+        pending = 0
+        exhausted = False
+
+        # The tracking subtask is also marked done if the caller stops
+        # early, or a chunk fails
+        try:
+            while True:
+                while not exhausted and pending < window:
+                    chunk = list(islice(args, size))
+                    if not chunk:
+                        exhausted = True
+                        break
+                    task.add_task(len(chunk))
+                    if ordered:
+                        inflight.append(
+                            p.apply_async(_run_chunk, (target, chunk)))
+                    else:
+                        p.apply_async(
+                            _run_chunk, (target, chunk),
+                            callback=completed.put,
+                            error_callback=completed.put)
+                    pending += 1
+                if pending == 0:
+                    break
+
+                if ordered:
+                    results, elapsed = inflight.popleft().get()
+                else:
+                    ret = completed.get()
+                    if isinstance(ret, BaseException):
+                        raise ret
+                    results, elapsed = ret
+                pending -= 1
+
+                # Exponential moving average of the time per argument
+                if chunksize is None and results:
+                    latency = elapsed / len(results)
+                    per_item = latency if per_item is None else (
+                        0.8 * per_item + 0.2 * latency)
+                    size = max(1, min(
+                        MAX_CHUNKSIZE,
+                        int(chunk_time / max(per_item, 1e-9))))
+
+                n_done += len(results)
+                task.add_progress(len(results))
+                yield from results
+        finally:
+            task.done(desc="Mapped {n} items".format(n=n_done))
+
+    async def amap(
+            self, target, args, *shared_args, concurrency=64,
+            name='Child Task Coroutine', ordered=True, errors="raise",
+            **shared_kwargs):
+        """Run a coroutine function on each argument on the event loop
+
+        Coroutines run concurrently on the current event loop instead of on
+        pool threads; at most ``concurrency`` run at a time. Arguments are
+        consumed from ``args`` as coroutines finish, so ``args`` can be a
+        long generator. Each argument gets its own subtask, which is passed
+        to ``target`` as for ``pool``.
+
+        Parameters
+        ----------
+        target : async (argument, *args, task=Task, **kwargs) -> result
+            Coroutine function to run on each argument
+        args : iterable
+            Arguments (arbitrary type)
+        *shared_args : arbitrary type
+            Additional arguments passed to each call
+        concurrency : int
+            Maximum number of coroutines running at a time
+        name : str
+            Name of the subtask created for each argument
+        ordered : bool
+            If True, results are returned in the order of ``args``;
+            otherwise, in completion order.
+        errors : "raise" or "return"
+            If "raise", a ``JobError`` for the first failed argument is
+            raised once all coroutines have finished; if "return",
+            ``JobError`` objects are returned in place of failed results
+            (at the end, if not ``ordered``).
+        **shared_kwargs : dict
+            Keyword arguments passed to each call
+
+        Returns
+        -------
+        list
+            Results of each call
+        """
+
+        if errors not in ("raise", "return"):
+            raise ValueError(
+                "errors must be 'raise' or 'return', not {e}".format(
+                    e=errors))
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+
+        self.attach_loop()
+        self.system(
+            'Started async map with concurrency {n}'.format(n=concurrency))
+
+        items = enumerate(args)
+        done = []
+        failed = []
+
+        # A fixed set of workers pulling from a shared iterator bounds the
+        # number of coroutines (and subtasks) in memory, unlike a semaphore
+        # with one coroutine per argument
+        async def worker():
+            for i, arg in items:
+                task = self.subtask(name=name)
+                try:
+                    result = await target(
+                        arg, *shared_args, task=task, **shared_kwargs)
+                except Exception as e:
+                    # Not already reported by ``async with task``
+                    if task.end_time is None:
+                        task.error(
+                            "{n}: {e}".format(n=type(e).__name__, e=e))
+                    failed.append(
+                        JobError(i, task.id, e, traceback.format_exc()))
+                else:
+                    done.append((i, result))
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        self.system("Finished async map.")
+
+        failed.sort(key=lambda e: e.index)
+        if errors == "raise" and failed:
+            raise failed[0]
+        if not ordered:
+            return [r for _, r in done] + failed
+
+        results = [None] * (len(done) + len(failed))
+        for i, r in done:
+            results[i] = r
+        for e in failed:
+            results[e.index] = e
+        return results
+
     def __thread_pool(
             self, target, args, shared_args=[], shared_kwargs={},
             reducer=None, recursive=True, split=2,
-            name='Child Task Thread', threads=None):
+            name='Child Task Thread', threads=None, stream=False,
+            ordered=True, errors="raise", schedule=None):
         """Run a task-wrapped thread pool
 
         Parameters
@@ -43,17 +330,38 @@ class ParallelMixin:
             Shared arguments to pass to each function call
         shared_kwargs : {arbitrary type}
             Shared keyword arguments to pass to each function
-        reducer : result[], task=subtask -> result
-            Combines multiple results into a single object.
+        reducer : result[] -> result
+            Combines multiple results into a single object. If not
+            ``recursive``, called once as ``reducer(results)``; if there are
+            no results, called once on an empty list. Each call made while
+            reducing recursively is tracked by its own subtask.
         recursive : bool
-            If True, the reducer is run recursively with multiple processes
-            to finish in O(log(n)) time.
+            If True, the reducer is run recursively on the pool threads to
+            finish in O(log(n)) rounds.
         split : int
             Number of results to assign to each reduce iteration.
         name : str
             Name of the child processes to create
         threads : int
             Number of threads to use
+        stream : bool
+            If True (and ``recursive``), results are reduced in groups of
+            ``split`` as soon as they are available, while the map is still
+            running. The reducer should then be commutative, since results
+            are reduced in completion order.
+        ordered : bool
+            If True, results are kept in the order of ``args``; otherwise,
+            they are in completion order.
+        errors : "raise" or "return"
+            If "raise", a ``JobError`` for the first failed argument is
+            raised after the map; if "return", ``JobError`` objects are
+            returned in place of failed results. Errors are always raised if
+            a reducer is given.
+        schedule : Scheduler or None
+            If not None, arguments are submitted in the order given by the
+            scheduler (for example ``LargestFirst``), and job runtime / tail
+            latency statistics are reported. Results are still returned in
+            the order of ``args``.
 
         Returns
         -------
@@ -62,14 +370,56 @@ class ParallelMixin:
             no reducer is provided, the results are returned as a list.
         """
 
+        if reducer is not None and recursive and split < 2:
+            raise ValueError("split must be at least 2.")
+
         self.system('Set up thread map')
-        p = ThreadPool(threads=threads)
+        p = self.pools.thread_pool(threads=threads)
+        # Maps started from a job running on the shared pool get their own
+        # pool, since waiting for them would occupy one of its workers
+        if current_pool() is p:
+            self.system('Set up nested thread map')
+            p = ThreadPool(threads=threads)
+            try:
+                return self.__thread_map(
+                    p, target, args, shared_args, shared_kwargs, reducer,
+                    recursive, split, name, stream, ordered, errors,
+                    schedule)
+            finally:
+                p.shutdown(wait=False)
+
         self.system(
-            'Started thread pool map with {i} processes'
-            .format(i=cpu_count() if threads is None else threads))
-        results = p.map(
-            target, args, *shared_args,
-            task=self, name=name, **shared_kwargs)
+            'Started thread pool map with {i} threads'
+            .format(i=p.threads))
+        return self.__thread_map(
+            p, target, args, shared_args, shared_kwargs, reducer,
+            recursive, split, name, stream, ordered, errors, schedule)
+
+    def __thread_map(
+            self, p, target, args, shared_args, shared_kwargs, reducer,
+            recursive, split, name, stream, ordered, errors, schedule):
+        """Map (and reduce) on a given thread pool"""
+
+        if reducer is not None and recursive and stream:
+            if schedule is not None:
+                args = list(args)
+                args = [args[i] for i in schedule.order(args)]
+            return self.__stream_reduce(
+                p, target, args, shared_args, shared_kwargs,
+                reducer, split, name)
+
+        def run(args, timings=None):
+            return p.map(
+                target, args, *shared_args,
+                task=self, name=name,
+                ordered=ordered or schedule is not None,
+                errors="raise" if reducer is not None else errors,
+                timings=timings, **shared_kwargs)
+
+        if schedule is None:
+            results = run(args)
+        else:
+            results = self.__scheduled_map(schedule, args, run)
         self.system("Finished map phase.")
 
         # Return immediately if reducer not supplied
@@ -77,30 +427,187 @@ class ParallelMixin:
             return results
 
         self.system('Reducing results...')
-        results = reducer(results)  # todo: handle recursive
+        if not recursive:
+            return reducer(results)
+
+        # Reduce in rounds until only one result remains; no results are
+        # reduced as ``reducer([])``
+        rnd = 1
+        while len(results) != 1:
+            rtask = self.subtask().start(
+                name="Reduce round {i}".format(i=rnd),
+                desc="Reducing {n} results".format(n=len(results)))
+
+            # A leftover single result is carried over to the next round
+            chunks = [
+                results[i:i + split]
+                for i in range(0, max(len(results), 1), split)]
+            carry = chunks.pop() if len(chunks[-1]) == 1 else None
+
+            results = p.map(
+                partial(_reduce_chunk, reducer), chunks, task=rtask,
+                name='Reducer')
+            if carry is not None:
+                results += carry
+
+            rtask.done(desc="Reduced into {n} results".format(n=len(results)))
+            rnd += 1
+
+        return results[0]
 
+    def __absorb(self, returned):
+        """Forward messages returned by ``_run_with_handle`` jobs
+
+        Parameters
+        ----------
+        returned : (arbitrary type, dict[], tuple or None)[]
+            (result, messages, error) for each job
+
+        Returns
+        -------
+        list
+            Results of each job
+
+        Raises
+        ------
+        JobError
+            For the first failed job, after the messages of every job have
+            been forwarded
+        """
+        results = []
+        failed = None
+        for i, (result, msgs, error) in enumerate(returned):
+            for msg in msgs:
+                self.reporter.put(msg)
+            results.append(result)
+            if error is not None and failed is None:
+                failed = JobError(i, *error)
+        if failed is not None:
+            raise failed
         return results
 
+    def __scheduled_map(self, schedule, args, run):
+        """Run a map in the order given by a scheduler
+
+        Parameters
+        ----------
+        schedule : Scheduler
+            Scheduler to order arguments with, and to record runtimes to
+        args : T[]
+            Arguments, in input order
+        run : (T[], list) -> result[]
+            Runs the map over reordered arguments (returning results in that
+            order), appending (index, start, end) timings to the list.
+
+        Returns
+        -------
+        result[]
+            Results, in input order
+        """
+
+        args = list(args)
+        perm = schedule.order(args)
+        timings = []
+        try:
+            results = run([args[i] for i in perm], timings)
+        except JobError as e:
+            e.index = perm[e.index]
+            raise
+
+        ordered = [None] * len(args)
+        for j, r in enumerate(results[:len(perm)]):
+            if isinstance(r, JobError):
+                r.index = perm[j]
+            ordered[perm[j]] = r
+        for j, start, end in timings:
+            schedule.record(args[perm[j]], end - start)
+
+        self.pool_stats = runtime_stats(timings)
+        self.update_metadata("pool_stats")
+        self.system(self.__format_stats(self.pool_stats))
+        return ordered
+
+    @staticmethod
+    def __format_stats(stats):
+        """Format runtime statistics as a single line"""
+
+        def fmt(t):
+            t, units = time_fmt(t)
+            return '{t:.2f}{u}'.format(t=t, u=units)
+
+        if stats["n"] == 0:
+            return "Job runtimes: no jobs"
+        return (
+            "Job runtimes: n={n} mean={mean} p50={p50} p90={p90} p99={p99} "
+            "max={max}; makespan={makespan}, tail={tail}".format(
+                n=stats["n"], **{
+                    k: fmt(v) for k, v in stats.items() if k != "n"}))
+
+    def __stream_reduce(
+            self, p, target, args, shared_args, shared_kwargs,
+            reducer, split, name):
+        """Run a thread pool map, reducing results as soon as they arrive
+
+        Every time ``split`` results (from the map, or from previous reduce
+        jobs) are waiting, a reduce job is added to the running pool.
+        """
+
+        rtask = self.subtask().start(
+            name="Reducer", desc="Reducing results as they arrive")
+        pending = []
+        mutex = Lock()
+
+        def collect(result):
+            with mutex:
+                pending.append(result)
+                if len(pending) < split:
+                    return
+                chunk = pending[:split]
+                del pending[:split]
+            p.put(AsyncJob(
+                target=partial(_reduce_chunk, reducer), args=[chunk],
+                kwargs={}, task=rtask.subtask(name='Reducer'),
+                callback=collect))
+
+        p.map(
+            target, args, *shared_args,
+            task=self, name=name, callback=collect, **shared_kwargs)
+        self.system("Finished map and streaming reduce phase.")
+
+        # Fewer than split results left (or none at all)
+        if len(pending) != 1:
+            pending = [_reduce_chunk(
+                reducer, pending, task=rtask.subtask(name='Reducer'))]
+        rtask.done(desc="Reduced results")
+
+        return pending[0]
+
     def __proc_pool(
             self, target, args,
             shared_args=None, shared_init=None,
             reducer=None, recursive=True, split=2,
-            name='Child Task Process', cores=None):
+            name='Child Task Process', cores=None, chunksize=None,
+            schedule=None, out=None):
         """Run a task-wrapped process pool
 
         Parameters
         ----------
         target : [arg, task] -> result
             Function to run on each argument; shared_args should be set as
-            globals by shared_init.
+            globals by shared_init. ``task`` is a handle (``Task.handle``)
+            whose messages are reported once the job returns, so the parent
+            task does not need ``mp=True``.
         args : T[]
             List of parameters (arbitrary type)
         shared_args : [arbitrary type]
-            Shared arguments to pass to each process
+            Shared arguments to pass to each process. NumPy arrays are copied
+            to shared memory once, and ``shared_init`` receives zero-copy
+            views (writes are seen by all workers).
         shared_init : shared_args -> void
             Set globals in order to handle shared arg inheritance
         reducer : result[], task=subtask -> result
-            Combines multiple results into a single object.
+            Combines multiple results into a single object; if there are no
+            results, called once on an empty list.
         recursive : bool
             If True, the reducer is run recursively with multiple processes
             to finish in O(log(n)) time.
@@ -110,32 +617,78 @@ class ParallelMixin:
             Name of the child processes to create
         cores : int
             Number of processes to use
+        chunksize : int or None
+            Number of arguments sent to a worker at a time; if None, picked by
+            ``multiprocessing.Pool.map`` (or 1, if ``schedule`` is set).
+        schedule : Scheduler or None
+            If not None, arguments are submitted in the order given by the
+            scheduler, and job runtime / tail latency statistics are
+            reported. Results are still returned in the order of ``args``.
+        out : SharedArray or None
+            If not None (see ``PoolManager.empty``), the result for argument
+            i is written to ``out.array[i]`` by the worker instead of being
+            pickled back; cannot be used with ``reducer`` or ``schedule``.
 
         Returns
         -------
-        Arbitrary type or T[]
+        Arbitrary type or T[] or numpy.ndarray
             List of reduced results generated by the provided reducer; if
-            no reducer is provided, the results are returned as a list.
+            no reducer is provided, the results are returned as a list. If
+            ``out`` is given, returns ``out.array``, which stays valid after
+            the root task is done.
+
+        Raises
+        ------
+        JobError
+            For the first failed argument, once the map (or reduce round) has
+            finished; the exception is also reported as an error event on
+            the failing subtask.
         """
 
+        if out is not None and (reducer is not None or schedule is not None):
+            raise ValueError(
+                "out cannot be combined with a reducer or schedule.")
+
         if shared_args is not None and shared_init is not None:
             self.system('Set up process map with initializer')
-            p = ProcPool(
-                processes=cores,
-                initializer=shared_init,
-                initargs=shared_args)
-
+            p = self.pools.process_pool(
+                cores=cores, initializer=shared_init, initargs=shared_args)
         else:
             self.system('Set up process map with no initializer')
-            p = ProcPool(processes=cores)
-
-        # Task generator expression
-        genexpr = ([arg, self.subtask(name=name)] for arg in args)
+            p = self.pools.process_pool(cores=cores)
 
         self.system(
             'Started process pool map with {i} processes'
             .format(i=cpu_count() if cores is None else cores))
-        results = p.map(target, genexpr)
+        # Workers get task handles, which send their messages back with the
+        # results instead of through the accountant queue
+        if out is not None:
+            genexpr = (
+                [(i, arg), self.subtask(name=name).handle()]
+                for i, arg in enumerate(args))
+            self.__absorb(p.map(
+                partial(_run_with_handle, partial(write_out, target, out)),
+                genexpr, chunksize=chunksize))
+            self.system('Finished map phase; results written in place.')
+            return out.array
+        elif schedule is None:
+            # Task generator expression
+            genexpr = (
+                [arg, self.subtask(name=name).handle()] for arg in args)
+            results = self.__absorb(p.map(
+                partial(_run_with_handle, target), genexpr,
+                chunksize=chunksize))
+        else:
+            def run(args, timings):
+                ret = p.map(
+                    partial(timed_call, partial(_run_with_handle, target)),
+                    [[arg, self.subtask(name=name).handle()] for arg in args],
+                    chunksize=1 if chunksize is None else chunksize)
+                timings += [
+                    (j, start, end) for j, (_, start, end) in enumerate(ret)]
+                return self.__absorb([r for r, _, _ in ret])
+
+            results = self.__scheduled_map(schedule, args, run)
         self.system('Finished map phase.')
 
         # Return immediately if no reducer required
@@ -147,14 +700,16 @@ class ParallelMixin:
             name="Reducer", desc="Reducing Results...")
         rtask_rd = 1
 
-        # Proceed until only one item remains
-        while len(results) > 1:
-            p = ProcPool(processes=cores)
-            results = p.map(
-                reducer, [
-                    [results[i:i + split], self]
-                    for i in range(0, len(results), split)
-                ])
+        # Proceed until only one item remains; reduce rounds run on the same
+        # worker processes as the map, and no results are reduced as
+        # ``reducer([])``
+        while len(results) != 1:
+            results = self.__absorb(p.map(
+                partial(_run_with_handle, reducer), [
+                    [results[i:i + split],
+                     rtask.subtask(name="Reducer").handle()]
+                    for i in range(0, max(len(results), 1), split)
+                ]))
 
             rtask.system('Finished round {i} of reduce'.format(i=rtask_rd))
             rtask_rd += 1
@@ -0,0 +1,186 @@
+"""Worker pools shared by a task tree"""
+
+from threading import Lock
+from multiprocessing import Pool as ProcPool
+
+from .threadpool import Pool as ThreadPool
+from .shared import SharedArray, shared_init, np
+
+
+class PoolManager:
+    """Worker pools shared by a root task and its subtasks
+
+    Pools are created on first use, and reused by later ``pool`` calls and
+    by every reduce round, instead of forking new workers each time. Shared
+    arrays are also owned by the manager. Everything is shut down by
+    ``shutdown``, which is called when the root task is done.
+    """
+
+    def __init__(self):
+        self.__mutex = Lock()
+        self.__proc = None
+        self.__proc_key = None
+        self.__threads = {}
+        self.__shared = {}
+        self.__arrays = []
+
+    def __reduce__(self):
+        """Pools cannot be sent to other processes; workers get a fresh
+        (empty) manager instead"""
+        return (PoolManager, ())
+
+    def thread_pool(self, threads=None):
+        """Get the shared thread pool with a given number of threads
+
+        Parameters
+        ----------
+        threads : int or None
+            Number of threads; if None, cpu_count() is used.
+
+        Returns
+        -------
+        threadpool.Pool
+            Thread pool; also a ``concurrent.futures.Executor``.
+        """
+
+        with self.__mutex:
+            pool = self.__threads.get(threads)
+            if pool is None:
+                pool = ThreadPool(threads=threads)
+                self.__threads[threads] = pool
+            return pool
+
+    def process_pool(self, cores=None, initializer=None, initargs=()):
+        """Get the shared process pool
+
+        Parameters
+        ----------
+        cores : int or None
+            Number of processes; if None, cpu_count() is used.
+        initializer : callable or None
+            Worker initializer
+        initargs : tuple or list
+            Initializer arguments. Compared by identity: passing the same
+            objects again reuses the pool, while different objects (or a
+            different initializer or number of cores) replace it. NumPy
+            arrays are copied to shared memory once (see ``share``), and the
+            initializer receives views of the shared copies.
+
+        Returns
+        -------
+        multiprocessing.Pool
+            Process pool
+        """
+
+        with self.__mutex:
+            key = (cores, initializer, tuple(initargs))
+            prev = self.__proc_key
+            if (
+                    self.__proc is None or prev[0] != cores or
+                    prev[1] is not initializer or
+                    len(prev[2]) != len(key[2]) or
+                    any(a is not b for a, b in zip(prev[2], key[2]))):
+                self.__close_proc()
+                if initializer is None:
+                    self.__proc = ProcPool(processes=cores)
+                else:
+                    self.__proc = ProcPool(
+                        processes=cores, initializer=shared_init,
+                        initargs=[initializer] + [
+                            self.__share(a) for a in initargs])
+                self.__proc_key = key
+            return self.__proc
+
+    def share(self, array, path=None):
+        """Copy an array into shared memory
+
+        Each array gets a single shared copy (per ``path``): sharing the same
+        array again returns the same handle, after copying the current
+        contents of the array into it. Changes made to the original array
+        are not seen by the shared copy until it is shared again.
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            Array to share
+        path : str or None
+            If not None, a memory-mapped file at this path is used instead of
+            a shared memory segment.
+
+        Returns
+        -------
+        SharedArray
+            Handle to the shared copy; pickled as a reference, so that
+            workers get a zero-copy view with ``handle.array``.
+        """
+        with self.__mutex:
+            return self.__share(array, path=path)
+
+    def __share(self, array, path=None):
+        """Share an array (if it is a NumPy array) without locking"""
+
+        if np is None or not isinstance(array, np.ndarray):
+            return array
+        key = (id(array), path)
+        entry = self.__shared.get(key)
+        if entry is None or entry[1].shape != array.shape or (
+                entry[1].dtype != array.dtype):
+            if entry is not None:
+                # Resized in place; the old copy may still be in use
+                self.__arrays.append(entry[1])
+            # Keep a reference to the array so that its id stays unique
+            entry = (array, SharedArray(array.shape, array.dtype, path=path))
+            self.__shared[key] = entry
+        entry[1].array[...] = array
+        return entry[1]
+
+    def empty(self, shape, dtype, path=None):
+        """Allocate an uninitialized shared array
+
+        Use as the ``out`` array of a process pool, to have results written
+        in place instead of pickled back to the parent.
+
+        Parameters
+        ----------
+        shape : int or int[]
+            Array shape
+        dtype : numpy dtype or str
+            Array data type
+        path : str or None
+            If not None, a memory-mapped file at this path is used.
+
+        Returns
+        -------
+        SharedArray
+            Handle to the new array. The memory is released by ``shutdown``,
+            but views obtained from ``handle.array`` before that stay valid
+            until they are garbage collected.
+        """
+        handle = SharedArray(shape, dtype, path=path)
+        with self.__mutex:
+            self.__arrays.append(handle)
+        return handle
+
+    def __close_proc(self):
+        """Close the process pool and wait for its workers to exit"""
+        if self.__proc is not None:
+            self.__proc.close()
+            self.__proc.join()
+            self.__proc = None
+            self.__proc_key = None
+
+    def shutdown(self):
+        """Shut down all pools"""
+        with self.__mutex:
+            self.__close_proc()
+            for pool in self.__threads.values():
+                pool.shutdown()
+            self.__threads = {}
+
+            # Release shared memory once no worker can use it anymore
+            for _, handle in self.__shared.values():
+                handle.close()
+            for handle in self.__arrays:
+                handle.close()
+            self.__shared = {}
+            self.__arrays = []
@@ -0,0 +1,159 @@
+"""Cost-aware ordering of pool arguments
+
+Both pools hand out arguments to idle workers from a single queue, so work
+is already balanced dynamically; what is left is the order. If a few
+expensive arguments come last, the other workers sit idle while they finish.
+Schedulers reorder arguments (results are still returned in input order)
+and record the runtime of each argument for later maps.
+"""
+
+import time
+
+
+class Scheduler:
+    """FIFO scheduler; keeps arguments in input order
+
+    Records per-argument runtimes, which are used to report runtime and tail
+    latency statistics for each map.
+
+    Parameters
+    ----------
+    key : arg -> hashable or None
+        Key used to remember runtimes of an argument across maps; if None,
+        the argument itself is used (if hashable).
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.runtimes = {}
+
+    def __key(self, arg):
+        """Get the runtime key for an argument (None if not hashable)"""
+        k = arg if self.key is None else self.key(arg)
+        try:
+            hash(k)
+        except TypeError:
+            return None
+        return k
+
+    def estimate(self, arg):
+        """Estimated cost of an argument
+
+        Returns
+        -------
+        float or None
+            Last measured runtime, or None if unknown
+        """
+        k = self.__key(arg)
+        return None if k is None else self.runtimes.get(k)
+
+    def order(self, args):
+        """Order arguments
+
+        Parameters
+        ----------
+        args : list
+            Arguments to map over
+
+        Returns
+        -------
+        int[]
+            Indices into ``args``, in the order they should be submitted
+        """
+        return list(range(len(args)))
+
+    def record(self, arg, runtime):
+        """Record the measured runtime of an argument"""
+        k = self.__key(arg)
+        if k is not None:
+            self.runtimes[k] = runtime
+
+
+class LargestFirst(Scheduler):
+    """Longest-processing-time-first scheduler
+
+    Arguments are submitted by decreasing estimated cost, so that the most
+    expensive arguments start first and the tail of the map is made of
+    cheap ones.
+
+    Parameters
+    ----------
+    cost : arg -> float or None
+        Cost hint (for example, a file size). If None, measured runtimes of
+        previous maps with the same scheduler are used; arguments without a
+        measurement are treated as average.
+    key : arg -> hashable or None
+        Key used to remember runtimes (see ``Scheduler``)
+    """
+
+    def __init__(self, cost=None, key=None):
+        super().__init__(key=key)
+        self.cost = cost
+
+    def order(self, args):
+        """Order arguments by decreasing cost (stable for ties)"""
+
+        if self.cost is not None:
+            costs = [self.cost(arg) for arg in args]
+        else:
+            costs = [self.estimate(arg) for arg in args]
+            known = [c for c in costs if c is not None]
+            default = sum(known) / len(known) if known else 0
+            costs = [default if c is None else c for c in costs]
+
+        return sorted(range(len(args)), key=lambda i: -costs[i])
+
+
+def runtime_stats(timings):
+    """Summarize job runtimes of a map
+
+    Parameters
+    ----------
+    timings : (int, float, float)[]
+        (index, start, end) for each job
+
+    Returns
+    -------
+    dict
+        Number of jobs, mean / p50 / p90 / p99 / max runtime, makespan (first
+        start to last end), and tail (last job start to last end, during
+        which at least one worker had nothing left to do). Times in seconds.
+    """
+
+    if not timings:
+        return {"n": 0}
+
+    runtimes = sorted(end - start for _, start, end in timings)
+    n = len(runtimes)
+
+    def pct(q):
+        return runtimes[min(n - 1, int(q * n))]
+
+    first = min(start for _, start, _ in timings)
+    last_start = max(start for _, start, _ in timings)
+    last_end = max(end for _, _, end in timings)
+    return {
+        "n": n,
+        "mean": sum(runtimes) / n,
+        "p50": pct(0.5),
+        "p90": pct(0.9),
+        "p99": pct(0.99),
+        "max": runtimes[-1],
+        "makespan": last_end - first,
+        "tail": last_end - last_start,
+    }
+
+
+def timed_call(target, arg):
+    """Call a target, recording wall clock start and end times
+
+    Module-level so that it can be sent to worker processes.
+
+    Returns
+    -------
+    (arbitrary type, float, float)
+        Result, start time, and end time
+    """
+    start = time.time()
+    result = target(arg)
+    return result, start, time.time()
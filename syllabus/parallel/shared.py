@@ -0,0 +1,178 @@
+"""Zero-copy shared arrays for process pools
+
+Large arrays passed to a process pool (through ``shared_args``, map
+arguments, or results) are pickled into every worker. ``SharedArray``
+instead places the data in a ``multiprocessing.shared_memory`` segment (or a
+memory-mapped file) once; only a small handle is pickled, and workers get
+NumPy views of the same memory.
+
+NumPy is optional; it is only needed to create or view shared arrays.
+"""
+
+import os
+import weakref
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require_numpy():
+    """Raise an informative error if NumPy is not installed"""
+    if np is None:
+        raise ImportError("Shared arrays require NumPy.")
+
+
+class SharedArray:
+    """Handle to an array in shared memory or a memory-mapped file
+
+    Handles are cheap to pickle: a worker process receiving one attaches to
+    the same memory instead of copying the data. Create handles with
+    ``PoolManager.share`` or ``PoolManager.empty``, which also clean them up.
+
+    Parameters
+    ----------
+    shape : int or int[]
+        Array shape
+    dtype : numpy dtype or str
+        Array data type
+    name : str or None
+        Name of an existing shared memory segment to attach to; if None (and
+        no ``path`` is given), a new segment is created.
+    path : str or None
+        If not None, the array is backed by this memory-mapped file instead
+        of a shared memory segment.
+    create : bool
+        Whether this handle created the memory (and should release it)
+    """
+
+    def __init__(self, shape, dtype, name=None, path=None, create=True):
+
+        self.__shm = None
+        self.__array = None
+        self.__buffer = None
+
+        _require_numpy()
+        self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.owner = create
+
+        nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        if path is not None:
+            if create:
+                np.memmap(
+                    path, dtype=self.dtype, mode='w+', shape=self.shape
+                ).flush()
+            self.name = None
+        else:
+            self.__shm = shared_memory.SharedMemory(
+                name=name, create=create, size=nbytes if create else 0)
+            self.name = self.__shm.name
+
+    def __reduce__(self):
+        """Pickle as a reference to the same memory"""
+        return (
+            SharedArray,
+            (self.shape, str(self.dtype), self.name, self.path, False))
+
+    @property
+    def array(self):
+        """NumPy view of the shared memory (no copy)"""
+
+        if self.__array is None:
+            if self.path is not None:
+                self.__array = np.memmap(
+                    self.path, dtype=self.dtype, mode='r+', shape=self.shape)
+            else:
+                # ``frombuffer`` keeps the buffer exported for as long as a
+                # view exists, so that the segment cannot be unmapped under
+                # it (``ndarray(buffer=...)`` does not)
+                flat = np.frombuffer(
+                    self.__shm.buf, dtype=self.dtype,
+                    count=int(np.prod(self.shape)))
+                self.__buffer = flat.base
+                self.__array = flat.reshape(self.shape)
+        return self.__array
+
+    def close(self):
+        """Release the memory; removes it if this handle created it
+
+        Views returned by ``array`` stay valid: if any are still in use, the
+        memory is only unmapped once they are garbage collected. Workers can
+        no longer attach to the memory afterwards.
+        """
+
+        self.__array = None
+        if self.__shm is not None:
+            if self.owner:
+                self.__shm.unlink()
+            self.__detach()
+        elif self.path is not None and self.owner:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.owner = False
+
+    def __del__(self):
+        """Unmap the memory once no view uses it (without removing it)"""
+        self.__array = None
+        if self.__shm is not None:
+            self.__detach()
+
+    def __detach(self):
+        """Unmap the shared memory segment, or, if views of it are still in
+        use, once they are garbage collected"""
+        try:
+            self.__shm.close()
+        except BufferError:
+            weakref.finalize(
+                self.__buffer, _close_quietly, self.__shm).atexit = False
+        self.__shm = None
+        self.__buffer = None
+
+
+def _close_quietly(shm):
+    """Close a shared memory segment once its last view is released"""
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def as_views(args):
+    """Replace shared array handles by NumPy views
+
+    Parameters
+    ----------
+    args : list or tuple
+        Arguments, possibly containing ``SharedArray`` handles
+
+    Returns
+    -------
+    list
+        Arguments, with each handle replaced by its ``array``
+    """
+    return [a.array if isinstance(a, SharedArray) else a for a in args]
+
+
+def shared_init(initializer, *args):
+    """Worker initializer calling ``initializer`` with array views"""
+    initializer(*as_views(args))
+
+
+def write_out(target, out, item):
+    """Run a process pool target, writing its result into a shared array
+
+    Parameters
+    ----------
+    target : [arg, task] -> result
+        Process pool target
+    out : SharedArray
+        Output array; the result of argument i is written to ``out[i]``.
+    item : [(int, arg), task]
+        Index and argument, and the target's task
+    """
+    (i, arg), task = item
+    out.array[i] = target([arg, task])
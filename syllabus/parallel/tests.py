@@ -0,0 +1,422 @@
+"""Unit Tests for Task-wrapped Pools"""
+
+import unittest
+import os
+import time
+import asyncio
+import random
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ..task import Task
+from .threadpool import JobError, Pool as ThreadPool
+from .schedule import LargestFirst, runtime_stats
+
+
+def square(x, task=None):
+    task.start()
+    task.done()
+    return x * x
+
+
+def proc_square(args):
+    x, task = args
+    task.start()
+    task.done()
+    return x * x
+
+
+def proc_report(args):
+    x, task = args
+    task.start(desc="x={x}".format(x=x))
+    task.info("hello {x}".format(x=x))
+    sub = task.subtask(name="Inner").start()
+    sub.add_task(2)
+    sub.add_progress(2)
+    sub.done()
+    task.done()
+    return x
+
+
+def proc_fail(args):
+    x, task = args
+    task.start()
+    task.info("hello {x}".format(x=x))
+    if x == 3:
+        raise ValueError("bad {x}".format(x=x))
+    task.done()
+    return x
+
+
+def proc_add(args):
+    results, task = args
+    task.start()
+    task.done()
+    return sum(results)
+
+
+def slow_identity(x, task=None):
+    time.sleep(random.random() * 0.002)
+    if x % 10 == 3:
+        raise ValueError(x)
+    return x
+
+
+def concat(results):
+    return sum(results, [])
+
+
+def nested(x, task=None):
+    return task.pool(square, range(x), reducer=sum, threads=2)
+
+
+def sleep_for(x, task=None):
+    time.sleep(x)
+    return x
+
+
+async def fetch(x, task=None):
+    async with task:
+        await asyncio.sleep(random.random() * 0.01)
+        if x == 7:
+            raise ValueError(x)
+        return x * x
+
+
+_DATA = None
+
+
+def set_data(data):
+    global _DATA
+    _DATA = data
+
+
+def row_sum(args):
+    i, task = args
+    # Shared args are views of shared memory, not private copies
+    assert _DATA.base is not None
+    return _DATA[i].sum()
+
+
+def double(x):
+    return 2 * x
+
+
+def double_below(x):
+    if x >= 50:
+        raise ValueError(x)
+    return 2 * x
+
+
+class Tests(unittest.TestCase):
+
+    def test_tree_reduce(self):
+
+        main = Task("Main").start()
+        for n in [0, 1, 2, 7, 64]:
+            for split in [2, 3]:
+                self.assertEqual(
+                    main.pool(
+                        square, range(n), reducer=sum, split=split,
+                        threads=4),
+                    sum(x * x for x in range(n)))
+            self.assertEqual(
+                main.pool(
+                    square, range(n), reducer=sum, split=split, threads=4,
+                    stream=True),
+                sum(x * x for x in range(n)))
+        main.done()
+
+        # Reducers do not take a task; each call is tracked by a subtask
+        main = Task("Main").start()
+        main.pool(square, range(8), reducer=sum, split=2, threads=4)
+        rounds = [
+            c for c in main.metadata(nowait=False)["children"]
+            if c["name"].startswith("Reduce round")]
+        self.assertEqual(
+            [len(r["children"]) for r in rounds], [4, 2, 1])
+        for r in rounds:
+            for c in r["children"]:
+                self.assertEqual(c["name"], "Reducer")
+                self.assertIsNotNone(c["end_time"])
+        main.done()
+
+    def test_stream_reduce(self):
+
+        main = Task("Main").start()
+        self.assertEqual(
+            main.pool(
+                square, range(100), reducer=sum, split=4, threads=4,
+                stream=True),
+            sum(x * x for x in range(100)))
+        main.done()
+
+    def test_process_pool_reuse(self):
+
+        main = Task("Main", mp=True).start()
+        for _ in range(2):
+            self.assertEqual(
+                main.pool(
+                    proc_square, range(16), reducer=proc_add, split=3,
+                    process=True, cores=2),
+                sum(x * x for x in range(16)))
+        self.assertEqual(
+            main.pool(
+                proc_square, [], reducer=proc_add, process=True, cores=2), 0)
+        pool = main.pools.process_pool(cores=2)
+        self.assertIs(pool, main.subtask().pools.process_pool(cores=2))
+        self.assertIsNot(pool, main.pools.process_pool(cores=3))
+        main.done()
+
+    def test_imap(self):
+
+        main = Task("Main").start()
+        self.assertEqual(
+            list(main.imap(double, iter(range(1000)), cores=2)),
+            [2 * x for x in range(1000)])
+        self.assertEqual(
+            sorted(main.imap(
+                double, range(1000), ordered=False, chunksize=7, cores=2)),
+            [2 * x for x in range(1000)])
+        self.assertEqual(list(main.imap(double, [], cores=2)), [])
+
+        # The tracking subtask is done even if the map stops early
+        stream = main.imap(double, range(1000), name="Early", cores=2)
+        self.assertEqual(next(stream), 0)
+        stream.close()
+        with self.assertRaises(ValueError):
+            list(main.imap(double_below, range(100), name="Failed", cores=2))
+        tree = main.metadata(nowait=False)
+        for c in tree["children"]:
+            self.assertIsNotNone(c["end_time"])
+        self.assertEqual(
+            {c["name"] for c in tree["children"]},
+            {"Process Map", "Early", "Failed"})
+        main.done()
+
+    def test_ordered_errors(self):
+
+        main = Task("Main").start()
+        ret = main.pool(
+            slow_identity, range(50), threads=4, errors="return")
+        self.assertEqual(len(ret), 50)
+        for i, r in enumerate(ret):
+            if i % 10 == 3:
+                self.assertIsInstance(r, JobError)
+                self.assertEqual(r.index, i)
+                self.assertIsInstance(r.exception, ValueError)
+            else:
+                self.assertEqual(r, i)
+
+        with self.assertRaises(JobError) as ctx:
+            main.pool(slow_identity, range(50), threads=4)
+        self.assertEqual(ctx.exception.index, 3)
+        events = main.metadata(ctx.exception.task, nowait=False)["events"]
+        self.assertEqual(events[-1]["type"], "error")
+
+        # Non-commutative reduce sees results in order
+        self.assertEqual(
+            main.pool(
+                lambda x, task=None: [x], range(30), reducer=concat,
+                split=3, threads=4),
+            list(range(30)))
+        main.done()
+
+    def test_persistent_thread_pool(self):
+
+        main = Task("Main").start()
+        pool = main.pools.thread_pool(threads=4)
+        self.assertIs(pool, main.subtask().pools.thread_pool(threads=4))
+
+        # Concurrent maps on the shared pool
+        out = {}
+
+        def run(k):
+            out[k] = main.pool(square, range(20 * k), threads=4)
+
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for k in range(4):
+            self.assertEqual(out[k], [x * x for x in range(20 * k)])
+
+        # Executor interface
+        self.assertEqual(pool.submit(pow, 2, 10).result(), 1024)
+        self.assertEqual(list(pool.map(pow, [2, 3], [3, 2])), [8, 9])
+        with self.assertRaises(ValueError):
+            pool.submit(int, "x").result()
+        self.assertIsInstance(
+            pool.submit(int, "x").exception(), ValueError)
+        with self.assertRaises(ValueError):
+            list(pool.map(int, ["1", "x"]))
+
+        # Nested maps do not deadlock the shared pool
+        self.assertEqual(
+            main.pool(nested, range(6), threads=2),
+            [sum(x * x for x in range(n)) for n in range(6)])
+
+        main.done()
+        self.assertFalse(any(w.is_alive() for w in pool.workers))
+        with self.assertRaises(RuntimeError):
+            pool.submit(pow, 2, 2)
+
+    def test_idle_pool(self):
+
+        # Idle workers, and a producer waiting for free slots, block instead
+        # of spinning
+        pool = ThreadPool(threads=8)
+        try:
+            start = time.process_time()
+            time.sleep(0.5)
+            self.assertLess(time.process_time() - start, 0.1)
+
+            main = Task("Main").start()
+            start = time.process_time()
+            pool.map(
+                sleep_for, [0.05] * 16, task=main, name="Sleep",
+                genexpr_limit=1)
+            self.assertLess(time.process_time() - start, 0.1)
+            main.done()
+        finally:
+            pool.shutdown()
+
+    def test_largest_first(self):
+
+        main = Task("Main").start()
+        costs = [0.001] * 12 + [0.05, 0.05]
+        sched = LargestFirst(cost=lambda x: x)
+        self.assertEqual(sched.order(costs)[:2], [12, 13])
+
+        # Results stay in input order; runtimes are recorded and reported
+        self.assertEqual(
+            main.pool(sleep_for, costs, threads=2, schedule=sched), costs)
+        self.assertEqual(main.pool_stats["n"], len(costs))
+        self.assertLess(
+            main.pool_stats["tail"], main.pool_stats["makespan"])
+        self.assertEqual(
+            main.metadata(nowait=False)["pool_stats"], main.pool_stats)
+
+        # Measured runtimes are used when no cost hint is given
+        sched = LargestFirst()
+        main.pool(sleep_for, costs, threads=2, schedule=sched)
+        self.assertEqual(
+            sorted(sched.order(costs)[:2]), [12, 13])
+        main.done()
+
+    def test_runtime_stats(self):
+
+        stats = runtime_stats([(i, 0, i + 1) for i in range(100)])
+        self.assertEqual(stats["n"], 100)
+        self.assertEqual(stats["max"], 100)
+        self.assertEqual(stats["p50"], 51)
+        self.assertEqual(stats["makespan"], 100)
+        self.assertEqual(stats["tail"], 100)
+        self.assertEqual(runtime_stats([]), {"n": 0})
+
+    @unittest.skipIf(np is None, "NumPy not installed")
+    def test_shared_arrays(self):
+
+        main = Task("Main", mp=True).start()
+        data = np.arange(40, dtype=np.float64).reshape(10, 4)
+        out = main.pools.empty(10, np.float64)
+        ret = main.pool(
+            row_sum, range(10), shared_args=[data], shared_init=set_data,
+            process=True, cores=2, out=out)
+        self.assertTrue(np.array_equal(ret, data.sum(axis=1)))
+
+        # Shared once; the pool is reused for the same arguments
+        handle = main.pools.share(data)
+        self.assertIs(handle, main.pools.share(data))
+        pool = main.pools.process_pool(
+            cores=2, initializer=set_data, initargs=[data])
+        self.assertEqual(
+            main.pool(
+                row_sum, range(10), shared_args=[data], shared_init=set_data,
+                process=True, cores=2),
+            list(data.sum(axis=1)))
+        self.assertIs(pool, main.pools.process_pool(
+            cores=2, initializer=set_data, initargs=[data]))
+
+        # Sharing again picks up changes
+        data[0, 0] = -1
+        self.assertIs(handle, main.pools.share(data))
+        self.assertEqual(handle.array[0, 0], -1)
+
+        # The returned array outlives the shared memory segment
+        main.done()
+        self.assertFalse(os.path.exists("/dev/shm/" + handle.name))
+        self.assertFalse(os.path.exists("/dev/shm/" + out.name))
+        self.assertEqual(ret.sum(), np.arange(40).sum())
+
+    def test_process_handles(self):
+
+        # No Manager process: workers report through task handles
+        main = Task("Main").start()
+        self.assertEqual(
+            main.pool(proc_report, range(8), process=True, cores=2),
+            list(range(8)))
+        tree = main.metadata(nowait=False)
+        children = [c for c in tree["children"] if "events" in c]
+        workers = [c for c in children if c["name"] == "Child Task Process"]
+        self.assertEqual(len(workers), 8)
+        for w in workers:
+            x = int(w["desc"][2:])
+            self.assertEqual(w["events"][0]["body"], "hello {x}".format(x=x))
+            self.assertIsNotNone(w["end_time"])
+            self.assertEqual(w["children"][0]["name"], "Inner")
+            self.assertEqual(w["children"][0]["progress"], 1.0)
+        main.done()
+
+    def test_process_errors(self):
+
+        main = Task("Main").start()
+        with self.assertRaises(JobError) as ctx:
+            main.pool(proc_fail, range(6), process=True, cores=2)
+        self.assertEqual(ctx.exception.index, 3)
+        self.assertIsInstance(ctx.exception.exception, ValueError)
+
+        # Messages of every job are kept, including the failing one's
+        tree = main.metadata(nowait=False)
+        workers = {
+            c["id"]: c for c in tree["children"]
+            if c["name"] == "Child Task Process"}
+        self.assertEqual(len(workers), 6)
+        failed = workers[ctx.exception.task]
+        self.assertEqual(
+            [e["type"] for e in failed["events"]], ["info", "error"])
+        self.assertEqual(failed["events"][1]["body"], "ValueError: bad 3")
+        for w in workers.values():
+            self.assertIn("hello", w["events"][0]["body"])
+        main.done()
+
+    def test_amap(self):
+
+        async def main():
+            async with Task("Main", asynchronous=True) as task:
+                # No accountant thread; messages are applied on the loop
+                self.assertFalse(task.accountant.is_alive())
+                results = await task.amap(
+                    fetch, range(200), concurrency=50, errors="return")
+                self.assertEqual(
+                    [r for i, r in enumerate(results) if i != 7],
+                    [x * x for x in range(200) if x != 7])
+                self.assertIsInstance(results[7], JobError)
+                with self.assertRaises(JobError):
+                    await task.amap(fetch, range(10), concurrency=3)
+
+                await asyncio.sleep(0.1)
+                tree = task.metadata()
+                self.assertEqual(len(tree["children"]), 210)
+                self.assertTrue(all(
+                    c["end_time"] is not None for c in tree["children"]))
+                failed = tree["children"][7]["events"]
+                self.assertEqual(failed[0]["type"], "error")
+            self.assertTrue(task.accountant.stopped)
+
+        asyncio.run(main())
@@ -1,66 +1,194 @@
-
 """Multiprocessing-like threading interface"""
 
 # Multithreading
 from multiprocessing import cpu_count
-from threading import Thread, main_thread
-from queue import Queue, Empty
-
-# AsyncJob named tuple
+from threading import (
+    Thread, BoundedSemaphore, Condition, Lock, local, current_thread)
+from concurrent.futures import Executor, Future
+from queue import Queue
+import traceback
+import time
+
+# AsyncJob named tuple; if callback is not None, it is called with the result
+# instead of collecting the result. ``index`` is the position of the job's
+# argument in the mapped list (None for jobs added with put). Jobs without a
+# task are called without the ``task`` keyword argument.
 from collections import namedtuple
-AsyncJob = namedtuple('Job', ['target', 'args', 'kwargs', 'task'])
+AsyncJob = namedtuple(
+    'Job', ['target', 'args', 'kwargs', 'task', 'callback', 'index'],
+    defaults=[None, None])
 
 
-class Worker(Thread):
-    """Worker thread
+# Pool and batch of the job running on the current worker thread
+_current = local()
+
+
+def current_pool():
+    """Get the pool running the current thread
+
+    Returns
+    -------
+    Pool or None
+        Pool, if called from one of its worker threads
+    """
+    return getattr(_current, "pool", None)
+
+
+class JobError(Exception):
+    """Exception raised by a thread pool job
+
+    Attributes
+    ----------
+    index : int or None
+        Index of the failing job's argument
+    task : str or None
+        ID of the failing job's subtask; the exception is also reported as an
+        error event on this subtask.
+    exception : Exception
+        Exception raised by the job
+    traceback : str
+        Formatted traceback of the exception
+    """
+
+    def __init__(self, index, task, exception, tb):
+        super().__init__(
+            "Job {i} (task {t}) failed: {n}: {e}".format(
+                i=index, t=task, n=type(exception).__name__, e=exception))
+        self.index = index
+        self.task = task
+        self.exception = exception
+        self.traceback = tb
+
+
+class Batch:
+    """Jobs belonging to a single map
 
     Parameters
     ----------
-    qrg_queue: queue.Queue
-        Argument queue. Fetches items from qrg_queue until terminated; marks
-        items with ```task_done```.
-    result_queue: queue.Queue
-        Results are put onto the result_queue.
+    limit : int or None
+        Maximum number of mapped jobs in flight; if None, unbounded.
 
     Attributes
     ----------
-    running : bool
-        Boolean flag to terminate the loop; ``run`` stops after the next
-        function call if ``Worker.running`` is set to false.
+    results : (int, arbitrary type)[]
+        (index, result) tuples, in completion order
+    errors : JobError[]
+        Errors raised by the batch's jobs and callbacks
+    timings : (int, float, float)[]
+        (index, start, end) wall clock times of each job
     """
 
-    def __init__(self, arg_queue, result_queue):
+    def __init__(self, limit=None):
+        self.results = []
+        self.errors = []
+        self.timings = []
+        self.__pending = 0
+        self.__cond = Condition(Lock())
+        self.__slots = None if limit is None else BoundedSemaphore(limit)
+
+    def add(self, job):
+        """Register a new job; blocks while the map's limit is reached"""
+        if job.index is not None and self.__slots is not None:
+            self.__slots.acquire()
+        with self.__cond:
+            self.__pending += 1
+
+    def done(self, job):
+        """Mark a job (and its callback) as finished"""
+        if job.index is not None and self.__slots is not None:
+            self.__slots.release()
+        with self.__cond:
+            self.__pending -= 1
+            if self.__pending == 0:
+                self.__cond.notify_all()
+
+    def join(self):
+        """Wait for all jobs, including jobs added by callbacks"""
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__pending == 0)
 
-        super().__init__()
 
-        self.arg_queue = arg_queue
-        self.result_queue = result_queue
+class Worker(Thread):
+    """Worker thread
 
-        self.running = True
+    Parameters
+    ----------
+    pool : Pool
+        Pool that the worker belongs to
+    arg_queue : queue.Queue
+        Argument queue of (job, future, batch) tuples. The worker runs until
+        it receives a ``None`` sentinel (see ``Pool.shutdown``).
+    """
+
+    def __init__(self, pool, arg_queue):
+
+        super().__init__(daemon=True)
+
+        self.pool = pool
+        self.arg_queue = arg_queue
 
     def run(self):
         """Run the worker thread"""
 
-        while main_thread().is_alive() and self.running:
-            not_empty = True
+        _current.pool = self.pool
+        while True:
+            item = self.arg_queue.get()
+            if item is None:
+                break
+            job, future, batch = item
+            _current.batch = batch
             try:
-                f, args, kwargs, task = self.arg_queue.get_nowait()
-                self.result_queue.put(f(*args, task=task, **kwargs))
-            except Empty:
-                not_empty = False
-            except Exception as e:
-                print(e)
+                self.__run(job, future, batch)
             finally:
-                if not_empty:
-                    self.arg_queue.task_done()
-
-    def stop(self):
-        """Stop the worker thread"""
-        self.running = False
-
-
-class Pool:
-    """Thread Pool object; initialize thread pool by creating workers
+                _current.batch = None
+                if batch is not None:
+                    batch.done(job)
+
+    def __run(self, job, future, batch):
+        """Run a single job, recording any exception it raises"""
+
+        f, args, kwargs, task, callback, index = job
+        if future is not None and not future.set_running_or_notify_cancel():
+            return
+
+        start = time.time()
+        try:
+            if task is None:
+                result = f(*args, **kwargs)
+            else:
+                result = f(*args, task=task, **kwargs)
+        except Exception as e:
+            if task is not None:
+                task.error("{n}: {e}".format(n=type(e).__name__, e=e))
+            if future is not None:
+                future.set_exception(e)
+            if batch is not None:
+                batch.errors.append(JobError(
+                    index, getattr(task, "id", None), e,
+                    traceback.format_exc()))
+            return
+
+        if future is not None:
+            future.set_result(result)
+        if batch is None:
+            return
+        batch.timings.append((index, start, time.time()))
+        if callback is None:
+            batch.results.append((index, result))
+            return
+        try:
+            callback(result)
+        except Exception as e:
+            batch.errors.append(JobError(
+                index, getattr(task, "id", None), e, traceback.format_exc()))
+
+
+class Pool(Executor):
+    """Persistent thread pool; initialize thread pool by creating workers
+
+    Workers are started on creation and run until ``shutdown``. Several
+    ``map`` calls (from different threads) and ``submit`` calls can share
+    the pool at the same time.
 
     Parameters
     ----------
@@ -76,14 +204,58 @@ class Pool:
         self.threads = threads
 
         self.task_queue = Queue()
-        self.result_queue = Queue()
+        self.__shutdown = False
+        self.__mutex = Lock()
         self.workers = [
-            Worker(self.task_queue, self.result_queue)
-            for _ in range(threads)]
+            Worker(self, self.task_queue) for _ in range(threads)]
+        for worker in self.workers:
+            worker.start()
+
+    def __enqueue(self, job, future=None, batch=None):
+        """Add a job to the task queue"""
+
+        # Waiting for a free slot must not hold the mutex, since workers
+        # may need it to add jobs (which frees up slots)
+        if batch is not None:
+            batch.add(job)
+        with self.__mutex:
+            if self.__shutdown:
+                if batch is not None:
+                    batch.done(job)
+                raise RuntimeError("Cannot add jobs after shutdown.")
+            self.task_queue.put((job, future, batch))
+
+    def submit(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future for the result; if ``fn`` raises an exception, the future
+            raises it as is (``JobError`` is only used by ``map``).
+        """
+        future = Future()
+        self.__enqueue(
+            AsyncJob(target=fn, args=args, kwargs=kwargs, task=None), future)
+        return future
+
+    def put(self, job):
+        """Add a job to a running map
+
+        Should only be called from a job or callback of the current map, so
+        that the map waits for the new job to finish.
+
+        Parameters
+        ----------
+        job : AsyncJob
+            Job to run
+        """
+        self.__enqueue(job, batch=getattr(_current, "batch", None))
 
     def map(
             self, target, arglist, *args,
-            task=None, name=None, genexpr_limit=None, **kwargs):
+            task=None, name=None, genexpr_limit=None, callback=None,
+            ordered=True, errors="raise", timings=None, **kwargs):
         """Run arguments asynchronously
 
         Parameters
@@ -96,48 +268,135 @@ class Pool:
             List of additional arguments; these arguments are passed to each
             function
         task : Task or None
-            task to register subtasks under
+            task to register subtasks under. If None, behaves as
+            ``concurrent.futures.Executor.map``: ``arglist`` and ``args`` are
+            iterables zipped into the arguments of ``target``.
         name : str or None
             default name of the generated task
+        genexpr_limit : int or None
+            Maximum number of queued jobs; defaults to the number of threads.
+            Submission blocks (without spinning) while the limit is reached.
+        callback : function (result) -> None or None
+            If not None, called (on the worker thread) with each result
+            instead of collecting the results
+        ordered : bool
+            If True, results are returned in the order of ``arglist``;
+            otherwise, they are returned in completion order.
+        errors : "raise" or "return"
+            If "raise", the ``JobError`` of the first failed argument is
+            raised once all jobs have finished. If "return", the
+            ``JobError`` is returned in place of the failed job's result
+            (appended at the end if not ``ordered``).
+        timings : list or None
+            If not None, (index, start, end) wall clock times of each
+            successful job are appended to this list.
         **kwargs : dict
             Keyword arguments to pass to each function
-        """
 
-        for worker in self.workers:
-            worker.start()
+        Returns
+        -------
+        list
+            Results of each job; if ``callback`` is set, only errors (if
+            ``errors="return"``) are returned. Results of jobs added with
+            ``put`` (without a callback) follow the mapped results.
+        """
 
-        # Check for task
         if task is None:
-            raise Exception("No parent task supplied.")
+            return super().map(target, arglist, *args, **kwargs)
 
-        # Make generator expression
-        genexpr = (
-            AsyncJob(
-                target=target, args=[arg] + list(args), kwargs=kwargs,
-                task=task.subtask(name=name))
-            for arg in arglist)
+        if errors not in ("raise", "return"):
+            raise ValueError(
+                "errors must be 'raise' or 'return', not {e}".format(
+                    e=errors))
 
         # Default genexpr_limit to number of threads; this should be
-        # increased for fast consumers
+        # increased for fast consumers. Jobs added with ``put`` (from
+        # workers) must never block, so only mapped jobs are bounded.
         if genexpr_limit is None:
             genexpr_limit = self.threads
+        batch = Batch(limit=genexpr_limit + self.threads)
+
+        # Make generator expression
+        genexpr = (
+            AsyncJob(
+                target=target, args=[arg] + list(args), kwargs=kwargs,
+                task=task.subtask(name=name), callback=callback, index=i)
+            for i, arg in enumerate(arglist))
 
-        # Create jobs until StopIteration is reached
+        # Create jobs until StopIteration is reached; blocks until a worker
+        # frees up a slot
+        size = 0
         for job in genexpr:
+            size += 1
+            self.__enqueue(job, batch=batch)
 
-            # Spin if queue is too large
-            while (
-                    main_thread().is_alive() and
-                    self.task_queue.qsize() > genexpr_limit):
-                pass
+        # Wait for all jobs to finish
+        batch.join()
+        if timings is not None:
+            timings += batch.timings
 
-            # Add job
-            self.task_queue.put(job)
+        return self.__collect(batch, size, ordered, errors, callback)
 
-        # Wait for all jobs to finish
-        self.task_queue.join()
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """Stop the workers once all queued jobs are done
 
-        for worker in self.workers:
-            worker.stop()
+        Parameters
+        ----------
+        wait : bool
+            If True, blocks until the workers have exited.
+        cancel_futures : bool
+            If True, queued jobs that have not started are cancelled.
+        """
 
-        return list(self.result_queue.queue)
+        with self.__mutex:
+            if not self.__shutdown:
+                self.__shutdown = True
+                if cancel_futures:
+                    self.__cancel_queued()
+                for _ in self.workers:
+                    self.task_queue.put(None)
+
+        if wait:
+            for worker in self.workers:
+                if worker is not current_thread():
+                    worker.join()
+
+    def __cancel_queued(self):
+        """Cancel submitted jobs that have not started; mapped jobs are
+        still run, since their map is waiting for them"""
+        kept = []
+        while not self.task_queue.empty():
+            item = self.task_queue.get_nowait()
+            if item[1] is not None:
+                item[1].cancel()
+            else:
+                kept.append(item)
+        for item in kept:
+            self.task_queue.put(item)
+
+    def __collect(self, batch, size, ordered, errors, callback):
+        """Gather results (and errors) after a map has finished"""
+
+        failed = sorted(
+            batch.errors,
+            key=lambda e: size if e.index is None else e.index)
+        if errors == "raise" and failed:
+            raise failed[0]
+
+        done = batch.results
+        if not ordered or callback is not None:
+            return [r for _, r in done] + failed
+
+        results = [None] * size
+        extra = []
+        for idx, r in done:
+            if idx is None:
+                extra.append(r)
+            else:
+                results[idx] = r
+        for e in failed:
+            if e.index is None:
+                extra.append(e)
+            else:
+                results[e.index] = e
+        return results + extra
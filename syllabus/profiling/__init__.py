@@ -0,0 +1,6 @@
+"""Memory and resource profiling"""
+
+from .sizeof import deep_sizeof
+from .resources import Usage, sample
+
+__all__ = ["deep_sizeof", "Usage", "sample"]
@@ -0,0 +1,156 @@
+"""Process memory and CPU time measurement
+
+All measurements are for the whole process: tasks running at the same time
+(for example in a thread pool) see each other's memory and CPU usage.
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss():
+    """Current resident set size of this process
+
+    Returns
+    -------
+    int or None
+        RSS in bytes; None if it cannot be measured on this platform
+        (install psutil for platforms without ``/proc``).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def max_rss():
+    """Peak resident set size of this process, in bytes (or None)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_SCALE
+
+
+def cpu_times():
+    """User and system CPU time of this process, in seconds"""
+    t = os.times()
+    return t.user, t.system
+
+
+# Open tracemalloc measurements. ``tracemalloc`` only keeps a single peak,
+# so before it is reset, the current peak is folded into every open window.
+_windows = []
+_windows_mutex = threading.Lock()
+
+
+def _fold_peak():
+    """Fold the current tracemalloc peak into every open window"""
+    peak = tracemalloc.get_traced_memory()[1]
+    for w in _windows:
+        w[0] = max(w[0], peak)
+
+
+class Usage:
+    """Resource usage measurement between ``start`` and ``stop``
+
+    Attributes
+    ----------
+    start_rss, start_cpu : int, (float, float)
+        RSS and CPU times at ``start``
+    """
+
+    def __init__(self):
+        self.__window = None
+        self.start_rss = None
+        self.start_cpu = None
+
+    def start(self):
+        """Start measuring"""
+
+        self.start_rss = rss()
+        self.start_cpu = cpu_times()
+
+        if tracemalloc.is_tracing():
+            self.__window = [0]
+            with _windows_mutex:
+                _fold_peak()
+                tracemalloc.reset_peak()
+                _windows.append(self.__window)
+        return self
+
+    def stop(self):
+        """Stop measuring
+
+        Returns
+        -------
+        dict
+            ``rss`` (bytes, at stop), ``rss_delta`` (change since start),
+            ``max_rss`` (process peak so far), ``cpu_user`` and ``cpu_system``
+            (seconds, since start), and ``tracemalloc_peak`` (peak traced
+            memory between start and stop; only if tracemalloc was tracing
+            at start). Unavailable values are None.
+        """
+
+        end_rss = rss()
+        user, system = cpu_times()
+        ret = {
+            "rss": end_rss,
+            "rss_delta": (
+                None if end_rss is None or self.start_rss is None
+                else end_rss - self.start_rss),
+            "max_rss": max_rss(),
+            "cpu_user": user - self.start_cpu[0],
+            "cpu_system": system - self.start_cpu[1],
+        }
+
+        if self.__window is not None:
+            with _windows_mutex:
+                if tracemalloc.is_tracing():
+                    _fold_peak()
+                # Windows with equal peaks compare equal, so remove this
+                # one by identity
+                for i, w in enumerate(_windows):
+                    if w is self.__window:
+                        del _windows[i]
+                        break
+            ret["tracemalloc_peak"] = self.__window[0]
+            self.__window = None
+
+        return ret
+
+
+def sample():
+    """Take a single resource sample
+
+    Returns
+    -------
+    dict
+        ``time``, ``rss``, ``cpu_user`` and ``cpu_system`` (totals for the
+        process)
+    """
+    user, system = cpu_times()
+    return {
+        "time": time.time(), "rss": rss(),
+        "cpu_user": user, "cpu_system": system}
@@ -0,0 +1,198 @@
+"""Deep object size measurement
+
+``sys.getsizeof`` only measures the object itself: a list of arrays is a few
+hundred bytes, and a dict of tensors is the size of the dict. ``deep_sizeof``
+follows references instead, and counts every object (and every data buffer)
+once.
+"""
+
+import sys
+import time
+from types import (
+    ModuleType, FunctionType, BuiltinFunctionType, MethodType,
+    MappingProxyType)
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Objects which are shared (not owned) by whatever references them
+_SKIP = (
+    type, ModuleType, FunctionType, BuiltinFunctionType, MethodType,
+    MappingProxyType)
+
+_SEQUENCES = (list, tuple, set, frozenset, deque)
+
+
+def _slots(obj):
+    """Get the values of all ``__slots__`` of an object"""
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name in ("__dict__", "__weakref__"):
+                continue
+            try:
+                yield getattr(obj, name)
+            except AttributeError:
+                pass
+
+
+def _is_pandas(obj):
+    """Check for pandas objects without importing pandas"""
+    return (
+        type(obj).__module__.startswith("pandas.") and
+        hasattr(obj, "memory_usage"))
+
+
+def _array_size(obj, buffers):
+    """Size of a NumPy array; data buffers shared by views are counted once
+
+    Parameters
+    ----------
+    obj : numpy.ndarray
+        Array to measure
+    buffers : set
+        IDs of data buffers that have already been counted
+
+    Returns
+    -------
+    int
+        Array header size, plus data size if not already counted
+    """
+
+    root = obj
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+
+    if obj.base is None:
+        header = sys.getsizeof(obj) - obj.nbytes
+    else:
+        header = sys.getsizeof(obj)
+
+    # Owned data, or data of another array: counted with that array. Data in
+    # a foreign buffer (bytes, mmap, shared memory) is counted for the
+    # buffer object.
+    key = id(root if root.base is None else root.base)
+    if key in buffers:
+        return header
+    buffers.add(key)
+    return header + (root.nbytes if root.base is None else obj.nbytes)
+
+
+def deep_sizeof(
+        *objects, max_objects=1000000, max_time=1.0, sample=None):
+    """Get the total memory footprint of objects and everything they contain
+
+    Handles containers, objects with ``__dict__`` or ``__slots__``, NumPy
+    arrays (views of the same buffer are counted once), memoryviews, pandas
+    objects (``memory_usage(deep=True)``), and other objects with an integer
+    ``nbytes`` attribute (such as tensors). Every object is counted once,
+    even if it is referenced several times. Classes, modules, and functions
+    are not followed.
+
+    Parameters
+    ----------
+    *objects : arbitrary type
+        Objects to measure
+    max_objects : int or None
+        Maximum number of objects to visit; if exceeded, the size of the
+        objects visited so far is returned (a lower bound).
+    max_time : float or None
+        Maximum traversal time, in seconds; same behavior as ``max_objects``.
+    sample : int or None
+        If not None, containers with more than ``sample`` items are measured
+        approximately, by visiting ``sample`` evenly spaced items and scaling
+        up their size.
+
+    Returns
+    -------
+    int
+        Size in bytes
+    """
+
+    seen = set()
+    buffers = set()
+    total = 0.0
+    visited = 0
+    deadline = None if max_time is None else time.perf_counter() + max_time
+
+    # (object, weight); weights > 1 scale up items of sampled containers
+    stack = [(obj, 1.0) for obj in objects]
+    while stack:
+        obj, weight = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP):
+            continue
+        seen.add(id(obj))
+
+        visited += 1
+        if max_objects is not None and visited > max_objects:
+            break
+        if deadline is not None and visited % 1024 == 0 and (
+                time.perf_counter() > deadline):
+            break
+
+        # Leaf objects with data buffers
+        if np is not None and isinstance(obj, np.ndarray):
+            total += weight * _array_size(obj, buffers)
+            if obj.dtype == object:
+                stack += [(x, weight) for x in obj.ravel()]
+            continue
+        if isinstance(obj, memoryview):
+            total += weight * sys.getsizeof(obj)
+            stack.append((obj.obj, weight))
+            continue
+        if _is_pandas(obj):
+            usage = obj.memory_usage(deep=True)
+            total += weight * int(
+                usage.sum() if hasattr(usage, "sum") else usage)
+            continue
+
+        total += weight * sys.getsizeof(obj)
+        if np is not None and isinstance(obj, np.generic):
+            continue
+        nbytes = getattr(obj, "nbytes", None)
+        if isinstance(nbytes, int) and not isinstance(
+                obj, (bytes, bytearray)):
+            if id(obj) not in buffers:
+                buffers.add(id(obj))
+                total += weight * nbytes
+            continue
+
+        # Containers
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, _SEQUENCES):
+            items = obj
+        else:
+            items = None
+
+        if items is not None:
+            n = len(items)
+            scaled = weight
+            if sample is not None and n > sample:
+                wanted = sorted({int(i * n / sample) for i in range(sample)})
+                if isinstance(items, (list, tuple)):
+                    items = [items[i] for i in wanted]
+                else:
+                    wanted = set(wanted)
+                    items = [x for i, x in enumerate(items) if i in wanted]
+                scaled = weight * n / len(items)
+            if isinstance(obj, dict):
+                for k, v in items:
+                    stack.append((k, scaled))
+                    stack.append((v, scaled))
+            else:
+                stack += [(x, scaled) for x in items]
+
+        # Attributes
+        if hasattr(obj, "__dict__") and not isinstance(obj, dict):
+            stack.append((obj.__dict__, weight))
+        if hasattr(type(obj), "__slots__"):
+            stack += [(x, weight) for x in _slots(obj)]
+
+    return int(total)
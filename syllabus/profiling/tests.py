@@ -0,0 +1,110 @@
+"""Unit Tests for Memory Profiling"""
+
+import sys
+import unittest
+import tracemalloc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .sizeof import deep_sizeof
+from .resources import Usage
+
+
+class Slotted:
+    __slots__ = ("a", "b")
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+
+class Tests(unittest.TestCase):
+
+    def test_containers(self):
+
+        payload = b"x" * 100000
+        self.assertGreater(deep_sizeof([payload]), 100000)
+        # Shared objects are counted once
+        self.assertLess(deep_sizeof([payload] * 10), 2 * 100000)
+        self.assertGreater(deep_sizeof({"k": (payload,)}), 100000)
+        self.assertGreater(deep_sizeof(Slotted(payload, None)), 100000)
+        self.assertEqual(deep_sizeof(), 0)
+
+    def test_buffers(self):
+
+        buf = bytearray(100000)
+        view = memoryview(buf)
+        size = deep_sizeof([view, view[10:], buf])
+        self.assertGreater(size, 100000)
+        self.assertLess(size, 2 * 100000)
+
+    @unittest.skipIf(np is None, "NumPy not installed")
+    def test_numpy(self):
+
+        a = np.zeros((500, 500))
+        self.assertGreaterEqual(deep_sizeof([a]), a.nbytes)
+        # Views share the data buffer of their base
+        size = deep_sizeof([a, a[10:], a[::2].T])
+        self.assertGreaterEqual(size, a.nbytes)
+        self.assertLess(size, a.nbytes + 1000)
+        self.assertGreaterEqual(deep_sizeof([a[10:]]), a.nbytes)
+
+    def test_limits(self):
+
+        big = [str(i) * 10 for i in range(100000)]
+        exact = deep_sizeof(big, max_time=None)
+        approx = deep_sizeof(big, sample=1000)
+        self.assertLess(abs(approx - exact) / exact, 0.1)
+        self.assertLess(
+            deep_sizeof(big, max_objects=10), sys.getsizeof(big) + 1000)
+
+    def test_usage(self):
+
+        tracemalloc.start()
+        try:
+            outer = Usage().start()
+            inner = Usage().start()
+            x = bytearray(10**7)
+            del x
+            inner = inner.stop()
+            after = Usage().start().stop()
+            outer = outer.stop()
+        finally:
+            tracemalloc.stop()
+
+        for k in ("rss", "rss_delta", "max_rss", "cpu_user", "cpu_system"):
+            self.assertIn(k, inner)
+        # Nested windows each see the peak
+        self.assertGreaterEqual(inner["tracemalloc_peak"], 10**7)
+        self.assertGreaterEqual(outer["tracemalloc_peak"], 10**7)
+        self.assertLess(after["tracemalloc_peak"], 10**7)
+
+        # Stopping an inner window does not close an outer window with the
+        # same peak
+        tracemalloc.start()
+        try:
+            outer = Usage().start()
+            Usage().start().stop()
+            x = bytearray(10**7)
+            del x
+            outer = outer.stop()
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(outer["tracemalloc_peak"], 10**7)
+
+    def test_task_usage(self):
+
+        from ..task import Task
+        main = Task("Main", profile=True, sample_interval=0.01).start()
+        sub = main.subtask("Sub").start()
+        sum(range(10**5))
+        sub.done()
+        main.done()
+
+        tree = main.metadata()
+        self.assertIn("cpu_user", tree["children"][0]["usage"])
+        self.assertGreaterEqual(len(tree["samples"]), 2)
+        self.assertIn("rss", tree["samples"][-1])
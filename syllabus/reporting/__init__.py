@@ -1,6 +1,11 @@
 
 from .accountant import Accountant
 from .reporter_mixins import ReporterMixin
-from .order import ordered_tree
+from .order import ordered_tree, OrderedTree
+from .tree import TaskTree
+from .eventlog import EventLog, read_log, is_event_log
+from .stream import stream_tree
 
-__all__ = ["Accountant", "ReporterMixin", "ordered_tree"]
+__all__ = [
+    "Accountant", "ReporterMixin", "ordered_tree", "OrderedTree",
+    "TaskTree", "EventLog", "read_log", "is_event_log", "stream_tree"]
@@ -6,41 +6,206 @@ import json
 # Threading
 import threading
 import time
+from itertools import count
 
 # Queue
 from queue import Empty as EmptyException
 from queue import Queue
-from multiprocessing import Manager
+import multiprocessing
 
+from .buffer import BufferedReporter
+from .tree import TaskTree
+from .eventlog import EventLog
+from .columns import to_json
 
-class Accountant(threading.Thread):
+
+class _LoopQueue(Queue):
+    """Queue of an asynchronous accountant
+
+    Every ``put`` (from any thread) schedules ``callback`` on the attached
+    event loop, unless a call is already scheduled.
+
+    Parameters
+    ----------
+    callback : () -> None
+        Function applying queued messages
+    """
+
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+        self.loop = None
+        self.__scheduled = False
+
+    def attach(self, loop):
+        """Apply messages from an event loop"""
+        self.loop = loop
+        self.__schedule()
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item, and wake the event loop"""
+        super().put(item, block, timeout)
+        self.__schedule()
+
+    def __schedule(self):
+        """Schedule the callback on the event loop"""
+        loop = self.loop
+        if loop is None or self.__scheduled:
+            return
+        self.__scheduled = True
+        try:
+            loop.call_soon_threadsafe(self.__run)
+        except RuntimeError:
+            # Event loop closed; messages are applied on the next flush
+            self.__scheduled = False
+            self.loop = None
+
+    def __run(self):
+        """Run the callback (on the event loop)"""
+        self.__scheduled = False
+        self.callback()
+
+
+class Accountant(TaskTree, threading.Thread):
     """Task Accountant
 
     Parameters
     ----------
     mp : bool
-        Enable multiprocessing? (Use Managed Queue instead of vanilla Queue)
+        Enable multiprocessing? (Use a queue shared between processes instead
+        of a vanilla Queue)
+    transport : "manager" or "queue"
+        Shared queue used if ``mp`` is True. "manager" uses a
+        ``Manager().Queue()``, which runs a server process and makes every
+        ``put`` a round trip to it, but can be pickled to any process (for
+        example as a pool argument). "queue" uses a ``multiprocessing.Queue``:
+        writers send messages down a pipe from a background feeder thread,
+        without a server process, but the queue (and tasks reporting to it)
+        can only be passed to processes when they are started (as
+        ``Process`` arguments or pool initializer arguments).
+    asynchronous : bool
+        If True, no accountant thread is started; messages are applied by
+        callbacks on an event loop once it is attached (see
+        ``_LoopQueue.attach`` and ``Task.__aenter__``), and by ``flush``.
+        Cannot be used with ``mp``.
     root : str
         Root node ID
+    log : str, EventLog or None
+        If not None, every applied message is also written to this
+        append-only JSONL event log (gzip-compressed if the filename ends in
+        '.gz'); the log is closed when the accountant stops.
+    sample_interval : float or None
+        If not None, a sampler thread calls ``sampler`` every
+        ``sample_interval`` seconds until the accountant stops; samples are
+        appended to the root task's ``samples`` (only the last
+        ``TaskTree.max_samples`` are kept, or ``max_events`` if set).
+    max_events : int or None
+        If not None, only the last ``max_events`` events of each task (plus
+        errors and warnings, or other ``pinned`` types) are kept in memory;
+        see ``TaskTree``.
+    pinned : str[]
+        Event types that are never dropped
+    spill : str, EventLog or None
+        If not None, dropped events are written to this JSONL event log
+        (which ``TaskViewer`` can merge back in); closed when the accountant
+        stops.
+    sampler : () -> dict, or None
+        Takes a resource sample (a dict with a ``time`` field); required if
+        ``sample_interval`` is set. ``Task`` passes ``profiling.sample``.
+
+    Attributes
+    ----------
+    queue : Queue, Manager().Queue() proxy, or multiprocessing.Queue
+        Message queue read by the accountant
+    reporter : BufferedReporter
+        Coalescing buffer in front of ``queue``; tasks should report through
+        this instead of using the queue directly
+    POLL_TIMEOUT : float
+        Maximum time, in seconds, to block on an empty queue before checking
+        for a stop request
+    MAX_BATCH : int
+        Maximum number of messages applied per mutex acquisition
     """
 
-    def __init__(self, mp=False, root=None):
-
-        super().__init__(daemon=True)
-
-        if mp:
-            self.queue = Manager().Queue()
-        else:
+    POLL_TIMEOUT = 0.1
+    MAX_BATCH = 4096
+
+    def __init__(
+            self, mp=False, root=None, log=None, sample_interval=None,
+            max_events=None, pinned=("error", "warning"), spill=None,
+            transport="manager", asynchronous=False, sampler=None):
+
+        if sample_interval is not None and sampler is None:
+            raise ValueError("sample_interval requires a sampler.")
+
+        if isinstance(spill, str):
+            spill = EventLog(spill)
+        TaskTree.__init__(
+            self, root=root, max_events=max_events, pinned=pinned,
+            spill=spill)
+        threading.Thread.__init__(self, daemon=True)
+
+        if asynchronous:
+            if mp:
+                raise ValueError(
+                    "Asynchronous accountants cannot be used with mp=True.")
+            self.queue = _LoopQueue(self.__drain)
+        elif not mp:
             self.queue = Queue()
+        elif transport == "manager":
+            self.queue = multiprocessing.Manager().Queue()
+        elif transport == "queue":
+            self.queue = multiprocessing.Queue()
+        else:
+            raise ValueError(
+                "transport must be 'manager' or 'queue', not {t}".format(
+                    t=transport))
+        self.reporter = BufferedReporter(self.queue)
 
-        self.task_log = {}
         self.task_log_mutex = threading.Lock()
-        self.root = root
+
+        # Held while taking messages off the queue and applying them, so
+        # that concurrent drains cannot reorder messages
+        self.asynchronous = asynchronous
+        self.__drain_mutex = threading.Lock()
+
+        if isinstance(log, str):
+            log = EventLog(log)
+        self.log = log
+        if log is not None and root is not None:
+            log.write([{"root": root}])
 
         self.__stop_request = False
         self.stopped = False
 
-        self.start()
+        # Flush markers: token -> threading.Event, set once the marker is
+        # dequeued (and everything queued before it has been applied)
+        self.__flush_tokens = count()
+        self.__flush_waiters = {}
+
+        if not asynchronous:
+            self.start()
+
+        self.sample_interval = sample_interval
+        self.sampler = sampler
+        self.__sampler_stop = threading.Event()
+        if sample_interval is not None and root is not None:
+            self.__sampler = threading.Thread(
+                target=self.__sample_loop, daemon=True)
+            self.__sampler.start()
+        else:
+            self.__sampler = None
+
+    def __sample_loop(self):
+        """Sampler thread; reports a resource sample of this process every
+        ``sample_interval`` seconds (and once more when stopped)"""
+
+        self.reporter.put({"id": self.root, "samples": [self.sampler()]})
+        while (
+                not self.__sampler_stop.wait(self.sample_interval) and
+                threading.main_thread().is_alive()):
+            self.reporter.put({"id": self.root, "samples": [self.sampler()]})
+        self.reporter.put({"id": self.root, "samples": [self.sampler()]})
 
     def run(self):
         """Run thread
@@ -49,11 +214,78 @@ class Accountant(threading.Thread):
         not set; sets stopped attribute to True once stopped
         """
         self.stopped = False
-        while threading.main_thread().is_alive() and not self.__stop_request:
-            self.accounting()
-        self.stopped = True
+        try:
+            while (
+                    threading.main_thread().is_alive() and
+                    not self.__stop_request):
+                self.accounting()
+        finally:
+            self.__finish()
+
+    def __finish(self):
+        """Close logs, and mark the accountant as stopped"""
+
+        try:
+            if self.log is not None:
+                self.log.close()
+            if self.spill is not None:
+                self.spill.close()
+        finally:
+            self.stopped = True
+            # Release anyone still waiting on a flush marker
+            for waiter in list(self.__flush_waiters.values()):
+                waiter.set()
+
+    def flush(self, timeout=None):
+        """Block until every message queued before this call is applied
+
+        This process's ``reporter`` buffer is sent first; then a flush marker
+        is placed on the queue. Since the queue is FIFO, all messages put
+        before the marker (by any thread or process) have been applied once
+        the accountant dequeues it. Asynchronous accountants apply the queued
+        messages in the calling thread instead.
 
-    def stop(self, nowait=False):
+        Parameters
+        ----------
+        timeout : float or None
+            Maximum time to wait, in seconds; if None, waits until the
+            marker is reached or the accountant stops.
+
+        Returns
+        -------
+        bool
+            True if the queue was flushed (or the accountant has stopped);
+            False if the timeout expired.
+        """
+
+        self.reporter.flush()
+        if self.asynchronous:
+            self.__drain()
+            return True
+        if self.stopped or not self.is_alive():
+            return True
+
+        token = next(self.__flush_tokens)
+        waiter = threading.Event()
+        self.__flush_waiters[token] = waiter
+        try:
+            self.queue.put({"flush": token})
+            # Wait in slices, in case the accountant stops (or dies) without
+            # reaching the marker
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                wait = 0.1 if deadline is None else min(
+                    0.1, deadline - time.time())
+                if waiter.wait(max(wait, 0)):
+                    return True
+                if self.stopped or not self.is_alive():
+                    return True
+                if deadline is not None and time.time() >= deadline:
+                    return False
+        finally:
+            del self.__flush_waiters[token]
+
+    def stop(self, nowait=False, timeout=None):
         """Make stop request, and block until accountant stopped
 
         Parameters
@@ -61,55 +293,104 @@ class Accountant(threading.Thread):
         nowait : bool
             If True, stops immediately; if false, waits for queue to
             empty first.
+        timeout : float or None
+            Maximum time to wait for the queue to flush and for the
+            accountant to stop (each); if None, waits indefinitely.
+
+        Returns
+        -------
+        bool
+            True if the accountant has stopped.
         """
 
+        # Take the last sample before flushing
+        self.__sampler_stop.set()
+        if self.__sampler is not None and self.__sampler.is_alive():
+            self.__sampler.join(timeout)
+
         # Block until queue empty
         if not nowait:
-            while self.queue.qsize() > 0:
-                pass
+            self.flush(timeout=timeout)
 
-        # Set flag
+        if self.asynchronous:
+            if not self.stopped:
+                self.flush()
+                self.__finish()
+            return True
+
+        # Set flag, and wake the accountant if it is blocked on the queue
         self.__stop_request = True
+        self.queue.put({"flush": None})
 
         # Block until stopped
-        while not self.stopped:
-            pass
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
 
-    def __add_new(self, uid):
-        """Add blank task"""
-        if uid not in self.task_log:
-            self.task_log[uid] = {"events": [], "children": [], "id": uid}
+        return self.stopped
 
     def accounting(self):
-        """Run accounting loop; called by run"""
+        """Run accounting loop; called by run
+
+        Blocks on the queue for up to ``POLL_TIMEOUT`` seconds, then drains
+        every message that is already available and applies the batch under
+        a single ``task_log_mutex`` acquisition. Queue items are single
+        messages, ``{"batch": [...]}`` lists of messages (sent by
+        ``BufferedReporter``), or ``{"flush": token}`` markers.
+        """
 
         try:
-            update = self.queue.get_nowait()
+            batch = [self.queue.get(timeout=self.POLL_TIMEOUT)]
         except EmptyException:
-            # Insert delay to prevent CPU hogging
-            time.sleep(0.01)
             return
-
-        self.task_log_mutex.acquire(True)
-
-        if self.root is None:
-            self.root = update.id
-
-        if update["id"] not in self.task_log:
-            self.__add_new(update["id"])
-
-        if "data" in update:
-            self.task_log[update["id"]].update(update["data"])
-        if "events" in update:
-            self.task_log[update["id"]]["events"] += update["events"]
-        if "children" in update:
-            self.task_log[update["id"]]["children"] += update["children"]
-            for child in update["children"]:
-                self.__add_new(child)
-
-        self.task_log_mutex.release()
-
-    def tree(self, root=None, nowait=True, previous=None):
+        self.__apply_batch(self.__take(batch))
+
+    def __drain(self):
+        """Apply every queued message without blocking (asynchronous
+        accountants)"""
+
+        with self.__drain_mutex:
+            while True:
+                batch = self.__take([])
+                if not batch:
+                    break
+                self.__apply_batch(batch)
+
+    def __take(self, batch):
+        """Add available messages to a batch, up to ``MAX_BATCH``"""
+
+        while len(batch) < self.MAX_BATCH:
+            try:
+                batch.append(self.queue.get_nowait())
+            except EmptyException:
+                break
+        return batch
+
+    def __apply_batch(self, batch):
+        """Apply a batch of queue items under a single mutex acquisition"""
+
+        flushed = []
+        applied = []
+        with self.task_log_mutex:
+            for update in batch:
+                if "flush" in update:
+                    flushed.append(update["flush"])
+                elif "batch" in update:
+                    for u in update["batch"]:
+                        self.apply(u)
+                    applied += update["batch"]
+                else:
+                    self.apply(update)
+                    applied.append(update)
+
+        if self.log is not None and applied:
+            self.log.write(applied)
+
+        for token in flushed:
+            waiter = self.__flush_waiters.get(token)
+            if waiter is not None:
+                waiter.set()
+
+    def tree(self, root=None, nowait=True):
         """Get task tree as dict
 
         Parameters
@@ -118,47 +399,22 @@ class Accountant(threading.Thread):
             Root node ID; if None, the program root is used.
         nowait : bool
             If True, the tree is computed immediately; if False, the task queue
-            is cleared first.
-        previous : str[]
-            Used by inductive step to prevent infinite loops on illegal
-            non-tree task topologies. Should not be used by the base case.
+            is flushed first.
 
         Returns
         -------
         dict
-            Dictionary representation of task tree
+            Dictionary representation of task tree. Subtrees that have not
+            changed since the last call are not rebuilt; the returned dict
+            should be treated as read-only.
         """
 
         # block until all task events are cleared
-        if not nowait and not self.stopped:
-            while self.queue.qsize() > 0:
-                pass
-
-        # Clear previous
-        if previous is None:
-            previous = []
-
-        # no root -> base case
-        if root is None:
-            if self.root is None:
-                return {}
-            else:
-                self.task_log_mutex.acquire()
-                ret = self.tree(self.root, nowait=True)
-                self.task_log_mutex.release()
-                return ret
-        # key not present or already visited -> return empty
-        elif root not in self.task_log or root in previous:
-            return {'id': root}
-        # root provided -> run recursive step
-        else:
-            previous.append(root)
-            return {
-                k: v if k != 'children' else [
-                    self.tree(c, previous=previous, nowait=True)
-                    for c in self.task_log[root]['children']]
-                for k, v in self.task_log[root].items()
-            }
+        if not nowait:
+            self.flush()
+
+        with self.task_log_mutex:
+            return TaskTree.tree(self, root=root)
 
     def json(self, root=None, pretty=False):
         """Get task tree as json
@@ -168,8 +424,9 @@ class Accountant(threading.Thread):
         root : str or None
             Root node ID; if None, the program root is used.
         pretty : bool
-            If True, a prettified json is returned. Otherwise, a minimal json
-            is created.
+            If True, a prettified json (with sorted keys) is returned.
+            Otherwise, a minimal json is created, with the fields and events
+            of each task before its children (see ``stream_tree``).
 
         Returns
         -------
@@ -177,10 +434,15 @@ class Accountant(threading.Thread):
             Json output of metadata dict
         """
 
+        # Event dicts are built while encoding, and not kept afterwards
+        with self.task_log_mutex:
+            tree = self.view(root=root)
+
         if pretty:
-            return json.dumps(self.tree(root=root), indent=4, sort_keys=True)
+            return json.dumps(
+                tree, indent=4, sort_keys=True, default=to_json)
         else:
-            return json.dumps(self.tree(root=root))
+            return json.dumps(tree, default=to_json)
 
     def save(self, file, pretty=False):
         """Save tree as a json to a file.
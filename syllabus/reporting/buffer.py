@@ -0,0 +1,232 @@
+"""Client-side message buffering
+
+Tasks send many small messages (``info``, ``add_progress``, ...); with
+``mp=True`` each ``put`` is a round trip to the Manager process. The
+``BufferedReporter`` gathers messages per task id, merges consecutive ``data``
+updates (so only the last value of each key survives), and forwards them to
+the accountant queue in bulk.
+
+Buffers are flushed when ``max_pending`` messages have been gathered, when the
+oldest pending message is ``interval`` seconds old (by a per-process flusher
+thread), on ``Task.done``, and when the process exits (including
+``multiprocessing`` workers, which skip ``atexit``).
+"""
+
+import os
+import time
+import atexit
+import threading
+import weakref
+from multiprocessing.util import Finalize, register_after_fork
+
+
+# Buffers registered in this process, and the flusher thread servicing them
+_buffers = weakref.WeakSet()
+_dirty = threading.Event()
+_flusher = None
+_flusher_mutex = threading.Lock()
+
+
+def _flush_loop():
+    """Flusher thread; flushes all dirty buffers at most ``interval`` after
+    the first message was buffered"""
+
+    while threading.main_thread().is_alive():
+        _dirty.wait()
+        _dirty.clear()
+        buffers = [b for b in _buffers if b.interval is not None]
+        if buffers:
+            time.sleep(min(b.interval for b in buffers))
+            for b in buffers:
+                b.flush()
+
+
+def _start_flusher():
+    """Start the flusher thread for this process, if not already running"""
+
+    global _flusher
+    with _flusher_mutex:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+
+
+def _flush_all():
+    """Flush every buffer in this process"""
+    for b in list(_buffers):
+        b.flush()
+
+
+def _reset_after_fork():
+    """Drop state inherited from the parent process
+
+    Pending messages belong to the parent, which will send them itself;
+    the parent's flusher thread does not exist in the child.
+    """
+
+    global _flusher, _flusher_mutex
+    _flusher = None
+    _flusher_mutex = threading.Lock()
+    _dirty.clear()
+    for b in list(_buffers):
+        b._reset()
+
+
+def _merge(pending, msg):
+    """Merge a message into the pending message of the same task
+
+    Parameters
+    ----------
+    pending : dict
+        Pending messages, by task id
+    msg : dict
+        New message
+    """
+
+    merged = pending.get(msg["id"])
+    if merged is None:
+        merged = {"id": msg["id"]}
+        pending[msg["id"]] = merged
+
+    if "data" in msg:
+        merged.setdefault("data", {}).update(msg["data"])
+    if "events" in msg:
+        merged.setdefault("events", []).extend(msg["events"])
+    if "children" in msg:
+        merged.setdefault("children", []).extend(msg["children"])
+    if "samples" in msg:
+        merged.setdefault("samples", []).extend(msg["samples"])
+
+
+def _register_exit_flush():
+    """Flush every buffer when this process exits
+
+    Processes started by ``multiprocessing`` (including pool workers) exit
+    with ``os._exit``, which skips ``atexit`` hooks, but run
+    ``multiprocessing`` finalizers; these are cleared in forked children, so
+    the finalizer is registered again after every fork. Its priority is
+    above those of queues and manager proxies, which are closed afterwards.
+    """
+    Finalize(None, _flush_all, exitpriority=100)
+
+
+atexit.register(_flush_all)
+_register_exit_flush()
+register_after_fork(_register_exit_flush, lambda f: f())
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class BufferedReporter:
+    """Coalescing buffer in front of an accountant queue
+
+    Parameters
+    ----------
+    queue : queue.Queue, Manager().Queue() proxy or multiprocessing.Queue
+        Accountant queue to forward messages to
+    max_pending : int
+        Number of buffered messages that triggers an immediate flush
+    interval : float or None
+        Maximum time, in seconds, that a message is held in the buffer; if
+        None, messages are only sent by ``flush`` (or once ``max_pending``
+        are gathered).
+    """
+
+    def __init__(self, queue, max_pending=256, interval=0.05):
+
+        self.queue = queue
+        self.max_pending = max_pending
+        self.interval = interval
+
+        self._reset()
+        _buffers.add(self)
+
+    def _reset(self):
+        """Clear pending messages and recreate the buffer mutex"""
+        self.__mutex = threading.Lock()
+        self.__pending = {}
+        self.__count = 0
+
+    def __reduce__(self):
+        """Pickle as a fresh, empty buffer around the same queue"""
+        return (
+            BufferedReporter, (self.queue, self.max_pending, self.interval))
+
+    def put(self, msg):
+        """Buffer a message
+
+        Parameters
+        ----------
+        msg : dict
+            Accountant message with "id" and optional "data", "events",
+            "children" and "samples" fields.
+        """
+
+        with self.__mutex:
+            _merge(self.__pending, msg)
+            self.__count += 1
+            full = self.__count >= self.max_pending
+
+        if full:
+            self.flush()
+        elif self.interval is not None and not _dirty.is_set():
+            _start_flusher()
+            _dirty.set()
+
+    def flush(self):
+        """Send all buffered messages to the accountant queue"""
+
+        with self.__mutex:
+            if not self.__pending:
+                return
+            pending = self.__pending
+            self.__pending = {}
+            self.__count = 0
+
+            # Put while holding the mutex, so that messages from a later
+            # flush can never overtake these. Multiple messages are sent as a
+            # single batch, which is one round trip for a Manager queue.
+            if len(pending) == 1:
+                self.queue.put(next(iter(pending.values())))
+            else:
+                self.queue.put({"batch": list(pending.values())})
+
+
+# Messages of tasks handed to this (worker) process with ``Task.handle``,
+# merged by task id
+_local = {}
+_local_mutex = threading.Lock()
+
+
+class LocalReporter:
+    """Reporter for task handles sent to worker processes
+
+    Messages are merged (as in ``BufferedReporter``) in a per-process buffer
+    instead of being sent to the accountant; the process pool collects them
+    with ``drain_local`` after each job, and ships them back to the parent
+    together with the result.
+    """
+
+    def put(self, msg):
+        """Keep a message until the current job is finished"""
+        with _local_mutex:
+            _merge(_local, msg)
+
+    def flush(self):
+        """Messages are sent with the job result; nothing to do"""
+        pass
+
+
+def drain_local():
+    """Remove and return the messages of task handles in this process
+
+    Returns
+    -------
+    dict[]
+        Merged messages, one per task
+    """
+    global _local
+    with _local_mutex:
+        msgs = list(_local.values())
+        _local = {}
+    return msgs
@@ -0,0 +1,335 @@
+"""Compact columnar storage for task events
+
+Storing each event as its own ``{"type", "time", "body"}`` dict costs a few
+hundred bytes per event before the body is counted. Instead, each task keeps
+its events in columns (8-byte timestamps, 2-byte type codes, and references
+to bodies), and bodies and types are interned in tables shared by the whole
+tree; repeated bodies (such as progress messages) are only stored once.
+Event dicts are only built when they are read, through ``EventView``
+sequences, which are what ``TaskTree.tree`` returns.
+"""
+
+from array import array
+from collections.abc import Sequence
+
+
+def _key(value):
+    """Interning key of a value; values of different types that compare
+    equal (``1``, ``1.0`` and ``True``) get different keys"""
+    return value if type(value) is str else (type(value), value)
+
+
+class ValueTable:
+    """Table of interned values, addressed by integer codes
+
+    Hashable values are stored once; unhashable values get a new code every
+    time. Codes are never reused, so tables should only hold values with few
+    distinct instances (such as event types).
+    """
+
+    def __init__(self):
+        self.values = []
+        self.__codes = {}
+
+    def code(self, value):
+        """Get the code of a value, adding it to the table if needed
+
+        Parameters
+        ----------
+        value : arbitrary type
+            Value to intern
+
+        Returns
+        -------
+        int
+            Index of the value in ``values``
+        """
+
+        key = _key(value)
+        try:
+            code = self.__codes.get(key)
+        except TypeError:
+            code = None
+            key = None
+
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            if key is not None:
+                self.__codes[key] = code
+        return code
+
+
+class InternTable:
+    """Reference counted table of interned values
+
+    Equal hashable values are replaced by a single shared instance;
+    unhashable values are passed through. Values are removed once they are
+    no longer used (see ``release``).
+    """
+
+    def __init__(self):
+        self.__values = {}
+
+    def intern(self, value):
+        """Get the shared instance of a value, adding it if needed"""
+
+        try:
+            key = _key(value)
+            entry = self.__values.get(key)
+        except TypeError:
+            return value
+
+        if entry is None:
+            entry = [value, 0]
+            self.__values[key] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, value):
+        """Release one reference to a value; unused values are removed"""
+
+        try:
+            key = _key(value)
+            entry = self.__values.get(key)
+        except TypeError:
+            return
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.__values[key]
+
+
+class EventColumns:
+    """Events of a single task, stored as columns
+
+    Parameters
+    ----------
+    types : ValueTable
+        Table of event types
+    bodies : InternTable
+        Table of event bodies
+    limit : int or None
+        If not None, only the last ``limit`` events whose type is not in
+        ``pinned`` are kept (at least; evictions are batched, so up to about
+        a quarter more may be held between evictions). Evicted events are
+        counted in ``dropped``.
+    pinned : set
+        Event types that are never evicted
+
+    Attributes
+    ----------
+    total : int
+        Number of events ever added
+    evictions : int
+        Number of times events were evicted; positions of kept events change
+        when this changes.
+    dropped : dict
+        Number of evicted events, by type
+    """
+
+    __slots__ = (
+        "types", "bodies", "time", "type", "body", "limit", "pinned",
+        "total", "evictions", "dropped", "n_pinned", "threshold")
+
+    def __init__(self, types, bodies, limit=None, pinned=()):
+        self.types = types
+        self.bodies = bodies
+        self.time = array('d')
+        self.type = array('H')
+        self.body = []
+
+        self.limit = limit
+        self.pinned = pinned
+        self.total = 0
+        self.evictions = 0
+        self.dropped = {}
+        self.n_pinned = 0
+        self.threshold = None if limit is None else limit + 16
+
+    def __len__(self):
+        return len(self.time)
+
+    def append(self, event):
+        """Add an event
+
+        Parameters
+        ----------
+        event : dict
+            Event with "type", "time" and "body" keys; other keys are not
+            stored.
+
+        Returns
+        -------
+        dict[]
+            Events evicted to stay within ``limit`` (usually none)
+        """
+        self.time.append(event["time"])
+        self.type.append(self.types.code(event["type"]))
+        self.body.append(self.bodies.intern(event["body"]))
+        self.total += 1
+        if event["type"] in self.pinned:
+            self.n_pinned += 1
+
+        if self.threshold is not None and len(self.time) > self.threshold:
+            return self.__evict()
+        return ()
+
+    def __evict(self):
+        """Evict the oldest unpinned events beyond ``limit``
+
+        Evictions happen once the number of events grows by a quarter (at
+        least 16) past the limit, so that the cost of rebuilding the columns
+        is amortized. Columns are replaced instead of modified in place, so
+        that views of the previous columns stay valid.
+        """
+
+        excess = len(self.time) - self.n_pinned - self.limit
+        evicted = []
+        keep = []
+        for i, code in enumerate(self.type):
+            if excess > 0 and self.types.values[code] not in self.pinned:
+                evicted.append(self.event(i))
+                self.bodies.release(self.body[i])
+                excess -= 1
+            else:
+                keep.append(i)
+
+        if evicted:
+            self.time = array('d', [self.time[i] for i in keep])
+            self.type = array('H', [self.type[i] for i in keep])
+            self.body = [self.body[i] for i in keep]
+            self.evictions += 1
+            for e in evicted:
+                self.dropped[e["type"]] = self.dropped.get(e["type"], 0) + 1
+
+        n = len(self.time)
+        self.threshold = max(n, self.limit) + max(16, n // 4)
+        return evicted
+
+    def event(self, i):
+        """Build the dict of event i"""
+        return {
+            "type": self.types.values[self.type[i]],
+            "time": self.time[i],
+            "body": self.body[i]}
+
+    def view(self):
+        """Read-only view of the current events; later changes are not
+        included
+
+        The view shares the columns instead of copying them: events are only
+        appended to the columns, and evictions replace them, so the first
+        ``len(self)`` entries never change.
+        """
+        return EventView(
+            self.time, self.type, self.body, self.types.values,
+            len(self.time))
+
+
+class _View(Sequence):
+    """Read-only list of the first items of columns which are only appended
+    to; subclasses build item i with ``_item``"""
+
+    __slots__ = ()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._item(j) for j in range(*i.indices(len(self)))]
+        return self._item(range(len(self))[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._item(i)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class EventView(_View):
+    """Read-only list of event dicts, built on access
+
+    Parameters
+    ----------
+    time : array
+        Event times
+    type : array
+        Event type codes
+    body : list
+        Event bodies
+    types : list
+        Event types, by code
+    n : int
+        Number of events (columns may be longer)
+
+    Attributes
+    ----------
+    origin : array
+        Time column the view was built from; views of the same task share
+        it until old events are evicted.
+    """
+
+    __slots__ = ("origin", "__type", "__body", "__types", "__n")
+
+    def __init__(self, time, type, body, types, n):
+        self.origin = time
+        self.__type = type
+        self.__body = body
+        self.__types = types
+        self.__n = n
+
+    def _item(self, i):
+        """Build the dict of event i"""
+        return {
+            "type": self.__types[self.__type[i]],
+            "time": self.origin[i],
+            "body": self.__body[i]}
+
+    def __len__(self):
+        return self.__n
+
+
+class SampleView(_View):
+    """Read-only view of the first n items of a list
+
+    Parameters
+    ----------
+    items : list
+        List which is only appended to (see ``TaskTree``)
+    n : int
+        Number of items in the view
+
+    Attributes
+    ----------
+    origin : list
+        List the view was built from
+    """
+
+    __slots__ = ("origin", "__n")
+
+    def __init__(self, items, n):
+        self.origin = items
+        self.__n = n
+
+    def _item(self, i):
+        return self.origin[i]
+
+    def __len__(self):
+        return self.__n
+
+
+def to_json(obj):
+    """``default`` hook for ``json.dump``, converting views to lists"""
+    if isinstance(obj, _View):
+        return list(obj)
+    raise TypeError(
+        "Object of type {t} is not JSON serializable".format(
+            t=type(obj).__name__))
@@ -0,0 +1,130 @@
+"""Append-only JSONL event log
+
+Every message applied by the accountant is written as one JSON object per
+line, so that the task tree can be rebuilt after a crash (``TaskViewer``
+accepts these logs). The first line records the root task::
+
+    {"root": <root id>}
+    {"id": <task id>, "data": {...}, "events": [...], "children": [...]}
+    ...
+"""
+
+import os
+import io
+import json
+import gzip
+import time
+
+
+class EventLog:
+    """Buffered JSONL (optionally gzip) writer for accountant messages
+
+    Parameters
+    ----------
+    file : str
+        Output file; an existing file is overwritten.
+    compress : bool or None
+        Write a gzip stream; if None, compression is used if the filename
+        ends in '.gz'.
+    fsync_interval : float
+        Minimum interval, in seconds, between flushing buffers to disk with
+        fsync. Messages written since the last fsync can be lost in a crash.
+    buffering : int
+        Size of the write buffer, in bytes
+    """
+
+    def __init__(
+            self, file, compress=None, fsync_interval=1.0,
+            buffering=1 << 16):
+
+        if compress is None:
+            compress = file.endswith('.gz')
+
+        self.file = file
+        self.fsync_interval = fsync_interval
+
+        self.__raw = open(file, 'wb', buffering=buffering)
+        if compress:
+            self.__stream = gzip.GzipFile(fileobj=self.__raw, mode='wb')
+        else:
+            self.__stream = self.__raw
+        self.__last_sync = time.time()
+
+    def write(self, messages):
+        """Write messages
+
+        Parameters
+        ----------
+        messages : dict[]
+            Messages to write. Objects that cannot be serialized (for example
+            arbitrary event bodies) are written as their ``str``.
+        """
+
+        for msg in messages:
+            self.__stream.write(
+                (json.dumps(msg, default=str) + '\n').encode('utf-8'))
+
+        if time.time() - self.__last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush buffers and fsync the file"""
+
+        # GzipFile.flush ends the current deflate block, so everything
+        # written so far can be decompressed from a truncated file
+        self.__stream.flush()
+        if self.__stream is not self.__raw:
+            self.__raw.flush()
+        os.fsync(self.__raw.fileno())
+        self.__last_sync = time.time()
+
+    def close(self):
+        """Flush and close the log"""
+
+        if self.__raw.closed:
+            return
+        self.sync()
+        self.__stream.close()
+        if self.__stream is not self.__raw:
+            self.__raw.close()
+
+
+def is_event_log(file):
+    """Check if a file name refers to a JSONL event log"""
+    return file.endswith('.jsonl') or file.endswith('.jsonl.gz')
+
+
+def read_log(file):
+    """Read messages from an event log
+
+    Parameters
+    ----------
+    file : str
+        Log file; gzip streams are detected from the file contents. A log
+        truncated by a crash is read up to the last complete message.
+
+    Yields
+    ------
+    dict
+        Messages, in the order they were written
+    """
+
+    with open(file, 'rb') as raw:
+        compressed = raw.read(2) == b'\x1f\x8b'
+
+    if compressed:
+        stream = io.TextIOWrapper(gzip.open(file, 'rb'), encoding='utf-8')
+    else:
+        stream = open(file, encoding='utf-8')
+
+    with stream:
+        try:
+            for line in stream:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Partially written last line
+                    return
+        except EOFError:
+            # Compressed stream ended without an end-of-stream marker
+            return
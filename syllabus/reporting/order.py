@@ -1,5 +1,218 @@
 """Convert task tree to ordered line-by-line representation"""
 
+from bisect import bisect_left
+from itertools import chain
+
+from .columns import EventView
+
+
+class _Entry:
+    """Cached ordering state of a single node
+
+    Attributes
+    ----------
+    node : dict
+        Tree node (snapshot) this entry was built from
+    indent : int
+        Indentation level of the node
+    lines : (int, dict)[]
+        Flattened line list of the subtree
+    keys : tuple[]
+        Sort keys of events and started children, in display order
+    segments : list[]
+        Line lists corresponding to ``keys``
+    n_events : int
+        Number of events already inserted into ``keys``
+    first : object
+        Origin of the node's events (see ``_origin``); if a later snapshot
+        has a different origin, old events were dropped (see ``TaskTree``),
+        and the entry is rebuilt.
+    children : {int: _Entry}
+        Entries of children, by position in the node's child list
+    started : {int: tuple}
+        Sort keys of started children, by position in the child list
+    waiting : {int: (int, dict)[]}
+        Line lists of children that have not started, by position in the
+        child list (in order)
+    """
+
+    def __init__(self, node, indent):
+        self.node = node
+        self.indent = indent
+        self.lines = None
+        self.keys = []
+        self.segments = []
+        self.n_events = 0
+        self.first = None
+        self.children = {}
+        self.started = {}
+        self.waiting = {}
+
+
+def _origin(events):
+    """Object identifying the start of an event list: the shared columns of
+    an ``EventView``, or the first event of a list"""
+    if isinstance(events, EventView):
+        return events.origin
+    return events[0] if events else None
+
+
+def _header(tree, indent):
+    """Task line; resource usage, the latest resource sample, and dropped
+    event counts are only included if the task has them"""
+    line = {
+        "id": tree["id"],
+        "progress": tree.get("progress"),
+        "size": tree.get("size"),
+        "name": tree.get("name"),
+        "desc": tree.get("desc"),
+        "start_time": tree.get("start_time"),
+        "end_time": tree.get("end_time")}
+    if tree.get("usage"):
+        line["usage"] = tree["usage"]
+    if tree.get("samples"):
+        line["sample"] = tree["samples"][-1]
+    if tree.get("dropped"):
+        line["dropped"] = tree["dropped"]
+    return (indent, line)
+
+
+class OrderedTree:
+    """Incremental ordered tree
+
+    Keeps the events and started children of every node in time order, and
+    caches each node's flattened line list. When called with a tree whose
+    unchanged subtrees are the same objects as in the previous call (as
+    returned by ``Accountant.tree``), only the changed nodes are re-ordered;
+    new events are inserted with bisect instead of re-sorting.
+    """
+
+    def __init__(self):
+        self.__root = None
+
+    def update(self, tree, indent=0):
+        """Get ordered representation of a task tree
+
+        Parameters
+        ----------
+        tree : dict
+            Dictionary to create ordered tree from.
+        indent : int
+            Indentation level of the root.
+
+        Returns
+        -------
+        (int, dict)[]
+            [(indentation level, line contents)]; should be treated as
+            read-only.
+        """
+
+        self.__root = self.__update(tree, indent, self.__root)
+        return self.__root.lines
+
+    def __update(self, tree, indent, entry):
+        """Update the entry of a single node
+
+        Parameters
+        ----------
+        tree : dict
+            Node to order
+        indent : int
+            Indentation level
+        entry : _Entry or None
+            Entry previously built for the node at this position
+        """
+
+        if entry is not None and entry.node is tree and entry.indent == indent:
+            return entry
+
+        # Stub node
+        if "children" not in tree:
+            entry = _Entry(tree, indent)
+            entry.lines = [_header(tree, indent)]
+            return entry
+
+        events = tree["events"]
+        if (
+                entry is None or entry.indent != indent or
+                "children" not in entry.node or
+                len(events) < entry.n_events or
+                (entry.n_events > 0 and _origin(events) is not entry.first)):
+            entry = _Entry(tree, indent)
+            old_children = ()
+        else:
+            old_children = entry.node["children"]
+        entry.node = tree
+        entry.first = _origin(events)
+
+        # New events (events are only ever appended)
+        for i in range(entry.n_events, len(events)):
+            event = events[i]
+            key = (event["time"], 1, i)
+            idx = bisect_left(entry.keys, key)
+            entry.keys.insert(idx, key)
+            entry.segments.insert(idx, [(indent + 1, {
+                "body": event["body"], "type": event["type"]})])
+        entry.n_events = len(events)
+
+        # Children: started children are ordered by start time (ahead of
+        # events with the same time); the rest are appended at the end.
+        # Children that are the same objects as last time are skipped.
+        for j, child in enumerate(tree["children"]):
+            if j < len(old_children) and old_children[j] is child:
+                continue
+            self.__update_child(entry, j, child)
+
+        entry.lines = [_header(tree, indent)]
+        entry.lines.extend(chain.from_iterable(entry.segments))
+        entry.lines.extend(chain.from_iterable(entry.waiting.values()))
+        return entry
+
+    def __update_child(self, entry, j, child):
+        """Update the entry and position of a changed child
+
+        Parameters
+        ----------
+        entry : _Entry
+            Parent entry
+        j : int
+            Position of the child in the parent's child list
+        child : dict
+            Child node
+        """
+
+        prev = entry.children.get(j)
+        prev_lines = None if prev is None else prev.lines
+        new = self.__update(child, entry.indent + 1, prev)
+        entry.children[j] = new
+
+        key = entry.started.get(j)
+        start = child.get("start_time")
+        if key is not None and (start is None or key[0] != start):
+            idx = bisect_left(entry.keys, key)
+            del entry.keys[idx]
+            del entry.segments[idx]
+            del entry.started[j]
+            key = None
+
+        if start is None:
+            in_order = (
+                j in entry.waiting or not entry.waiting or
+                next(reversed(entry.waiting)) < j)
+            entry.waiting[j] = new.lines
+            if not in_order:
+                entry.waiting = dict(sorted(entry.waiting.items()))
+        else:
+            entry.waiting.pop(j, None)
+            if key is None:
+                key = (start, 0, j)
+                entry.started[j] = key
+                idx = bisect_left(entry.keys, key)
+                entry.keys.insert(idx, key)
+                entry.segments.insert(idx, new.lines)
+            elif new.lines is not prev_lines:
+                entry.segments[bisect_left(entry.keys, key)] = new.lines
+
 
 def ordered_tree(tree, indent=0):
     """Get ordered representation of a task tree
@@ -9,8 +222,7 @@ def ordered_tree(tree, indent=0):
     tree : dict
         Dictionary to create ordered tree from.
     indent : int
-        Current indentation level. Used by inductive step; should not be
-        passed by user
+        Current indentation level.
 
     Returns
     -------
@@ -18,33 +230,4 @@ def ordered_tree(tree, indent=0):
         [(indentation level, line contents)]
     """
 
-    ordered = [(indent, {
-        "id": tree["id"],
-        "progress": tree.get("progress"),
-        "size": tree.get("size"),
-        "name": tree.get("name"),
-        "desc": tree.get("desc"),
-        "start_time": tree.get("start_time"),
-        "end_time": tree.get("end_time")})]
-
-    if "children" not in tree:
-        return ordered
-
-    orderables = [
-        c for c in tree["children"] if c.get("start_time") is not None
-    ] + tree["events"]
-    orderables.sort(
-        key=lambda x: x["time"] if "time" in x else x["start_time"])
-    ordered_single_level = orderables + [
-        c for c in tree["children"] if c.get("start_time") is None]
-
-    for event in ordered_single_level:
-        if "children" in event:
-            ordered += ordered_tree(event, indent=indent + 1)
-        else:
-            ordered.append((indent + 1, {
-                "body": event["body"],
-                "type": event["type"]
-            }))
-
-    return ordered
+    return OrderedTree().update(tree, indent=indent)
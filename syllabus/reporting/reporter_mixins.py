@@ -1,8 +1,49 @@
 """Task reporting methods"""
 
-import uuid
+import os
 import time
+import copy
+import asyncio
+from itertools import count
 from .accountant import Accountant
+from .buffer import LocalReporter
+
+
+def _new_prefix():
+    """ID prefix for this process: the PID (unique among running processes)
+    and a random part (so that a reused PID does not repeat IDs)"""
+    return "{p:x}{r}:".format(p=os.getpid(), r=os.urandom(3).hex())
+
+
+# Task IDs are "<process prefix><counter>" in hexadecimal, such as
+# "1f2a9c03be:1a"; the counter is reset with a new prefix in forked children.
+_prefix = _new_prefix()
+_counter = count()
+
+
+def _reset_after_fork():
+    """Use a new ID prefix in a forked child process"""
+    global _prefix, _counter
+    _prefix = _new_prefix()
+    _counter = count()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def new_id():
+    """Generate a task ID
+
+    IDs are short strings, unique across processes (including worker
+    processes of ``mp=True`` tasks and process pools).
+
+    Returns
+    -------
+    str
+        New task ID
+    """
+    return _prefix + format(next(_counter), 'x')
 
 
 class ReporterMixin:
@@ -17,15 +58,51 @@ class ReporterMixin:
         '(no description available)' when displayed
     root : bool
         True if this is the root task, and False otherwise
-    reporter : Accountant object
-        Reporter for task tracking
+    reporter : BufferedReporter
+        Reporter for task tracking (the root accountant's ``reporter``)
     mp : bool
-        True if multiprocessing should be enabled (Manager.Queue used); False
-        otherwise (normal Queue; to be used with threading)
+        True if multiprocessing should be enabled (a queue shared between
+        processes is used); False otherwise (normal Queue; to be used with
+        threading)
+    transport : "manager" or "queue"
+        Root task only: shared queue used if ``mp`` is True (see
+        ``Accountant``)
+    asynchronous : bool
+        Root task only: if True, messages are applied on the asyncio event
+        loop (attached by ``async with`` or ``attach_loop``) instead of by an
+        accountant thread; see ``Accountant``.
+    log : str or None
+        Root task only: if not None, all task messages are streamed to this
+        JSONL event log as they are processed (see ``Accountant``)
+    profile : bool
+        If True, the process's memory and CPU usage between ``start`` and
+        ``done`` is reported as the task's ``usage`` (see
+        ``profiling.Usage``); inherited by subtasks.
+    sample_interval : float or None
+        Root task only: if not None, the accountant samples the process's
+        memory and CPU usage every ``sample_interval`` seconds, and records
+        them as the root task's ``samples`` (the last 3600, or
+        ``max_events`` if set).
+    max_events : int or None
+        Root task only: if not None, only the last ``max_events`` events and
+        samples of each task are kept in memory. Errors and warnings (or
+        other ``pinned`` event types) are always kept; dropped events are
+        counted by type (see ``Accountant``).
+    pinned : str[]
+        Root task only: event types which are never dropped
+    spill : str or None
+        Root task only: if not None, dropped events are written to this JSONL
+        event log; ``TaskViewer(..., spill=...)`` merges them back in.
+    sampler : () -> dict, or None
+        Root task only: takes the resource samples recorded every
+        ``sample_interval`` seconds (``Task`` passes ``profiling.sample``)
     """
 
     def __init__(
-            self, name='Task', desc=None, root=True, reporter=None, mp=False):
+            self, name='Task', desc=None, root=True, reporter=None, mp=False,
+            log=None, profile=False, sample_interval=None, max_events=None,
+            pinned=("error", "warning"), spill=None, transport="manager",
+            asynchronous=False, sampler=None):
 
         # Display parameters
         self.name = name
@@ -36,10 +113,12 @@ class ReporterMixin:
         self.start_time = None
         self.end_time = None
         self.size = 0
+        self.profile = profile
+        self.usage = None
 
         # Task tracking
         self.children = {}
-        self.id = str(uuid.uuid4())
+        self.id = new_id()
 
         # Logging
         self.events = []
@@ -53,8 +132,12 @@ class ReporterMixin:
         if root:
             # should not provide reporter
             assert reporter is None, "Root task should not have a reporter."
-            self.accountant = Accountant(mp=mp, root=self.id)
-            self.reporter = self.accountant.queue
+            self.accountant = Accountant(
+                mp=mp, root=self.id, log=log,
+                sample_interval=sample_interval, max_events=max_events,
+                pinned=pinned, spill=spill, transport=transport,
+                asynchronous=asynchronous, sampler=sampler)
+            self.reporter = self.accountant.reporter
             # Bind reporter methods
             self.metadata = self.accountant.tree
             self.json = self.accountant.json
@@ -65,6 +148,39 @@ class ReporterMixin:
             assert reporter is not None, "Non-root task must have a reporter"
             self.reporter = reporter
 
+    def handle(self):
+        """Get a lightweight handle to send to a worker process
+
+        The handle is a copy of the task (without its children) which keeps
+        messages in the worker process instead of sending them to the
+        accountant; the process pool returns them together with the job's
+        result (see ``LocalReporter``). Handles do not need ``mp=True``.
+
+        Returns
+        -------
+        Task
+            Copy of this task reporting through a ``LocalReporter``
+        """
+        h = copy.copy(self)
+        h.reporter = LocalReporter()
+        h.children = {}
+        return h
+
+    def attach_loop(self, loop=None):
+        """Apply messages of an asynchronous accountant on an event loop
+
+        Does nothing if the root task was not created with
+        ``asynchronous=True``.
+
+        Parameters
+        ----------
+        loop : asyncio event loop or None
+            Event loop to use; if None, the running event loop is used.
+        """
+        attach = getattr(getattr(self.reporter, "queue", None), "attach", None)
+        if attach is not None:
+            attach(asyncio.get_running_loop() if loop is None else loop)
+
     #
     # -- Reporter -------------------------------------------------------------
     #
@@ -0,0 +1,424 @@
+"""Streaming parser for saved task trees
+
+Saved trees (``Accountant.save``) can be several gigabytes; ``json.loads``
+needs the whole file as a string plus the decoded dict tree. ``stream_tree``
+instead tokenizes the file in chunks, and yields the (optionally formatted)
+output lines of each task as soon as their position is known; only the
+lines of tasks that cannot be placed yet are kept in memory.
+"""
+
+import re
+import json
+from itertools import chain
+
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<str>"(?:[^"\\]|\\.)*")
+    |(?P<num>-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    |(?P<lit>true|false|null|NaN|-?Infinity)
+    |(?P<punct>[{}\[\]:,])
+)''', re.VERBOSE)
+
+_LITERALS = {
+    'true': True, 'false': False, 'null': None,
+    'NaN': float('nan'), 'Infinity': float('inf'),
+    '-Infinity': float('-inf')}
+
+
+def tokenize(f, chunk_size=1 << 20):
+    """Split a JSON text stream into tokens
+
+    Parameters
+    ----------
+    f : file-like
+        Text stream
+    chunk_size : int
+        Number of characters to read at a time
+
+    Yields
+    ------
+    (str, str)
+        (token type, token text); type is one of 'str', 'num', 'lit', or
+        'punct'.
+    """
+
+    buf = ''
+    pos = 0
+    eof = False
+    while True:
+        m = _TOKEN.match(buf, pos)
+        # Numbers and literals ending near the end of the buffer may be cut
+        # off (cut off strings do not match at all)
+        if m is None or (m.end() + 32 > len(buf) and not eof):
+            if eof:
+                if buf[pos:].strip():
+                    raise ValueError(
+                        "Invalid JSON near: " + buf[pos:pos + 40])
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        pos = m.end()
+        yield m.lastgroup, m.group(m.lastgroup)
+
+
+class _Frame:
+    """Parser state of a task object
+
+    Attributes
+    ----------
+    depth : int
+        Nesting depth of the task
+    node : dict
+        Task fields other than events and children
+    events : dict[] or None
+        Events of the task (None if not read yet); sorted by time once the
+        task is live
+    children : list or None
+        Start time and lines of each buffered child (None if the task has no
+        child list, or the child list has not been reached yet)
+    listing : bool
+        Whether the parser is inside the child list of the task
+    live : bool
+        Whether the lines of the task are yielded as they are parsed,
+        instead of being buffered until the task is closed
+    next_event : int
+        Number of events yielded (live tasks only)
+    waiting : list
+        Lines of children that have not started; yielded last (live tasks
+        only)
+    discard : bool
+        Whether the lines of the task are not needed (only a subtree that
+        does not contain this task is returned)
+    """
+
+    __slots__ = (
+        "depth", "node", "events", "children", "listing", "live",
+        "next_event", "waiting", "discard")
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.node = {}
+        self.events = None
+        self.children = None
+        self.listing = False
+        self.live = False
+        self.next_event = 0
+        self.waiting = []
+        self.discard = False
+
+
+class _Parser:
+    """Task tree parser over a token stream
+
+    Tasks are parsed with an explicit stack, so that the depth of the tree is
+    not limited by the recursion limit. A task is live (yielded as it is
+    parsed) if its parent is live (or it is the returned subtree), its fields
+    and events come before its child list, and it has started; otherwise,
+    its lines are buffered until it is closed.
+
+    Attributes
+    ----------
+    depth : int
+        Depth of the returned subtree; set before its first line is yielded.
+    """
+
+    def __init__(self, file, fmt, types, root, chunk_size):
+        self.file = file
+        self.fmt = fmt
+        self.types = types
+        self.root = root
+        self.chunk_size = chunk_size
+        self.depth = 0
+        self.__next = None
+
+    def next(self):
+        """Get the next token"""
+        try:
+            return self.__next()
+        except StopIteration:
+            raise ValueError("Unexpected end of file") from None
+
+    def expect(self, text):
+        """Consume a punctuation token"""
+        kind, tok = self.next()
+        if tok != text:
+            raise ValueError(
+                "Expected '{e}', got '{t}'".format(e=text, t=tok))
+
+    def value(self, kind=None, tok=None):
+        """Parse a generic JSON value"""
+
+        if kind is None:
+            kind, tok = self.next()
+
+        if kind == 'str' or kind == 'num':
+            return json.loads(tok)
+        elif kind == 'lit':
+            return _LITERALS[tok]
+        elif tok == '{':
+            ret = {}
+            kind, tok = self.next()
+            while tok != '}':
+                self.expect(':')
+                ret[json.loads(tok)] = self.value()
+                kind, tok = self.next()
+                if tok == ',':
+                    kind, tok = self.next()
+            return ret
+        elif tok == '[':
+            ret = []
+            kind, tok = self.next()
+            while tok != ']':
+                ret.append(self.value(kind, tok))
+                kind, tok = self.next()
+                if tok == ',':
+                    kind, tok = self.next()
+            return ret
+        else:
+            raise ValueError("Unexpected token '{t}'".format(t=tok))
+
+    def __iter__(self):
+        """Parse the file, yielding (formatted) lines of the returned
+        subtree"""
+        with open(self.file) as f:
+            self.__next = tokenize(f, self.chunk_size).__next__
+            yield from self.__tasks()
+
+    def __tasks(self):
+        """Parse the task objects of the tree"""
+
+        self.expect('{')
+        stack = [_Frame(0)]
+        kind, tok = self.next()
+        while stack:
+            frame = stack[-1]
+            parent = stack[-2] if len(stack) > 1 else None
+
+            # Inside a child list: next child, or end of the list
+            if frame.listing:
+                if tok == ']':
+                    frame.listing = False
+                    kind, tok = self.next()
+                    if tok == ',':
+                        kind, tok = self.next()
+                elif tok == '{':
+                    stack.append(_Frame(frame.depth + 1))
+                    kind, tok = self.next()
+                else:
+                    raise ValueError(
+                        "Expected task object, got '{t}'".format(t=tok))
+                continue
+
+            # End of a task object
+            if tok == '}':
+                stack.pop()
+                done = yield from self.__close(frame, parent)
+                if done:
+                    return
+                if parent is not None:
+                    kind, tok = self.next()
+                    if tok == ',':
+                        kind, tok = self.next()
+                continue
+
+            key = json.loads(tok)
+            self.expect(':')
+            if key == 'children':
+                self.expect('[')
+                frame.children = []
+                frame.listing = True
+                yield from self.__open(frame, parent)
+                kind, tok = self.next()
+                continue
+            elif key == 'events':
+                frame.events = [
+                    e for e in self.value()
+                    if self.types is None or e.get("type") in self.types]
+            else:
+                frame.node[key] = self.value()
+            kind, tok = self.next()
+            if tok == ',':
+                kind, tok = self.next()
+
+    def __header(self, frame):
+        """Formatted task line"""
+        node = frame.node
+        line = {
+            "id": node.get("id"),
+            "progress": node.get("progress"),
+            "size": node.get("size"),
+            "name": node.get("name"),
+            "desc": node.get("desc"),
+            "start_time": node.get("start_time"),
+            "end_time": node.get("end_time")}
+        if node.get("usage"):
+            line["usage"] = node["usage"]
+        if node.get("samples"):
+            line["sample"] = node["samples"][-1]
+        if node.get("dropped"):
+            line["dropped"] = node["dropped"]
+        return self.fmt((frame.depth, line))
+
+    def __events_before(self, frame, start):
+        """Yield the events of a live task up to a start time (children
+        go before events with the same time)"""
+        events = frame.events
+        while frame.next_event < len(events) and (
+                start is None or events[frame.next_event]["time"] < start):
+            e = events[frame.next_event]
+            frame.next_event += 1
+            yield self.fmt((frame.depth + 1, {
+                "body": e["body"], "type": e["type"]}))
+
+    def __target(self, frame, parent):
+        """Whether a task is the root of the returned subtree"""
+        if self.root is None:
+            return parent is None
+        return frame.node.get("id") == self.root and (
+            frame.children is not None)
+
+    def __open(self, frame, parent):
+        """Start the child list of a task; the task goes live if possible"""
+
+        target = self.__target(frame, parent)
+        if self.root is not None and "id" in frame.node and not target:
+            frame.discard = parent is None or parent.discard
+
+        if frame.events is None or "id" not in frame.node:
+            return
+        if target:
+            self.depth = frame.depth
+        elif not (
+                parent is not None and parent.live and
+                frame.node.get("start_time") is not None):
+            return
+        else:
+            yield from self.__events_before(
+                parent, frame.node["start_time"])
+
+        frame.live = True
+        frame.events = sorted(frame.events, key=lambda e: e["time"])
+        yield self.__header(frame)
+
+    def __close(self, frame, parent):
+        """Finish a task; returns True once the returned subtree is done"""
+
+        if frame.live:
+            yield from self.__events_before(frame, None)
+            for lines in frame.waiting:
+                yield from lines
+            return parent is None or not parent.live
+
+        target = self.__target(frame, parent)
+        if not target and (
+                frame.discard or parent is None or parent.discard):
+            return False
+
+        lines = [self.__header(frame)]
+        if frame.children is not None:
+            lines += order_lines(
+                frame.events or [], frame.children, frame.depth, self.fmt)
+
+        start = frame.node.get("start_time")
+        if target:
+            self.depth = frame.depth
+            yield from lines
+            return True
+        elif parent.live:
+            if start is None:
+                parent.waiting.append(lines)
+            else:
+                yield from self.__events_before(parent, start)
+                yield from lines
+        else:
+            parent.children.append((start, lines))
+        return False
+
+
+def order_lines(events, children, depth, fmt):
+    """Order the events and children of a single task
+
+    Same ordering as ``ordered_tree``: started children and events by time
+    (children first on ties), then children that have not started.
+
+    Parameters
+    ----------
+    events : dict[]
+        Events of the task
+    children : (float or None, list)[]
+        Start time and ordered lines of each child
+    depth : int
+        Indentation level of the task
+    fmt : (int, dict) -> arbitrary type
+        Line formatter
+
+    Returns
+    -------
+    list
+        Lines of the events and children
+    """
+
+    keyed = [
+        ((start, 0, j), lines)
+        for j, (start, lines) in enumerate(children) if start is not None]
+    keyed += [
+        ((e["time"], 1, i), [fmt((depth + 1, {
+            "body": e["body"], "type": e["type"]}))])
+        for i, e in enumerate(events)]
+    keyed.sort(key=lambda x: x[0])
+
+    ret = []
+    for _, lines in keyed:
+        ret += lines
+    for start, lines in children:
+        if start is None:
+            ret += lines
+    return ret
+
+
+def stream_tree(file, fmt=None, types=None, root=None, chunk_size=1 << 20):
+    """Parse and order a saved task tree incrementally
+
+    Lines are yielded as they are parsed for files written by
+    ``Accountant.save``, which writes the fields and events of each task
+    before its children, and children in start order. Tasks of other files
+    (such as files with sorted keys) are ordered once they are closed.
+
+    Parameters
+    ----------
+    file : str
+        JSON file written by ``Accountant.save``
+    fmt : (int, dict) -> arbitrary type or None
+        Applied to every (indentation, line) tuple as soon as it is created;
+        if None, lines are kept as tuples. Formatting to strings keeps memory
+        usage close to the size of the output.
+    types : str[] or None
+        If not None, only events of these types are kept.
+    root : str or None
+        If not None, only the subtree with this ID is returned; parsing stops
+        as soon as the subtree is complete.
+    chunk_size : int
+        Number of characters to read at a time
+
+    Returns
+    -------
+    (int, iterator)
+        Depth of the returned subtree (0 for the whole tree), and its lines
+        (none if ``root`` was not found). The file is parsed up to the first
+        line before returning, and read further as lines are consumed.
+    """
+
+    if fmt is None:
+        def fmt(line):
+            return line
+    if types is not None:
+        types = set(types)
+
+    parser = _Parser(file, fmt, types, root, chunk_size)
+    lines = iter(parser)
+    for first in lines:
+        return parser.depth, chain([first], lines)
+    return 0, iter(())
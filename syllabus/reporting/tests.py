@@ -1,9 +1,75 @@
 """Unit Tests for Accountant"""
 
 from print import print
+import os
+import json
 import unittest
+import random
+import tempfile
+import threading
+import tracemalloc
+from itertools import product
+import multiprocessing
 from .accountant import Accountant
-from .order import ordered_tree
+from .order import ordered_tree, OrderedTree
+from .buffer import BufferedReporter
+from .tree import TaskTree
+from .columns import to_json
+from .eventlog import read_log
+from .stream import stream_tree
+from .reporter_mixins import new_id
+
+
+def buffer_event(reporter):
+    reporter.put({"id": 'root', "data": {'progress': 1.0}})
+
+
+def sorted_tree(tree, indent=0):
+    """Reference ordering: sort each node's started children and events by
+    time (a stable sort puts children first on ties), then append children
+    that have not started"""
+
+    header = {
+        "id": tree["id"],
+        "progress": tree.get("progress"),
+        "size": tree.get("size"),
+        "name": tree.get("name"),
+        "desc": tree.get("desc"),
+        "start_time": tree.get("start_time"),
+        "end_time": tree.get("end_time")}
+    if tree.get("usage"):
+        header["usage"] = tree["usage"]
+    if tree.get("samples"):
+        header["sample"] = tree["samples"][-1]
+    if tree.get("dropped"):
+        header["dropped"] = tree["dropped"]
+    ordered = [(indent, header)]
+
+    if "children" not in tree:
+        return ordered
+
+    orderables = [
+        c for c in tree["children"] if c.get("start_time") is not None
+    ] + list(tree["events"])
+    orderables.sort(
+        key=lambda x: x["time"] if "time" in x else x["start_time"])
+    orderables += [
+        c for c in tree["children"] if c.get("start_time") is None]
+
+    for item in orderables:
+        if "children" in item or "time" not in item:
+            ordered += sorted_tree(item, indent=indent + 1)
+        else:
+            ordered.append((indent + 1, {
+                "body": item["body"], "type": item["type"]}))
+    return ordered
+
+
+def send_events(reporter, i):
+    for j in range(100):
+        reporter.put({"id": 'root', "events": [
+            {'body': (i, j), 'type': 'info', 'time': j}]})
+    reporter.flush()
 
 
 class Tests(unittest.TestCase):
@@ -38,7 +104,7 @@ class Tests(unittest.TestCase):
             "events": [],
             "children": []})
 
-        self.assertEqual(accountant.tree(), {
+        self.assertEqual(accountant.tree(nowait=False), {
             "id": "test-root",
             "start_time": 100,
             "progress": 0.521,
@@ -73,7 +139,7 @@ class Tests(unittest.TestCase):
             ]
         })
 
-        self.assertEqual(ordered_tree(accountant.tree()), [
+        self.assertEqual(ordered_tree(accountant.tree(nowait=False)), [
             (0, {
                 'id': 'test-root',
                 'progress': 0.521,
@@ -118,7 +184,7 @@ class Tests(unittest.TestCase):
             "events": [],
             "children": ['root']})
 
-        self.assertEqual(accountant.tree(), {
+        self.assertEqual(accountant.tree(nowait=False), {
             "id": "root",
             "is_root": True,
             "events": [],
@@ -127,5 +193,371 @@ class Tests(unittest.TestCase):
             ]
         })
 
+        # Pretty output sorts keys; minimal output lists children last
+        pretty = accountant.json(pretty=True)
+        self.assertEqual(
+            pretty, json.dumps(json.loads(pretty), indent=4, sort_keys=True))
+        self.assertEqual(list(json.loads(accountant.json()))[-1], "children")
+
         accountant.stop()
         self.assertTrue(accountant.stopped)
+
+    def test_flush(self):
+
+        accountant = Accountant(root='root')
+        q = accountant.queue
+
+        for i in range(1000):
+            q.put({
+                "id": 'root',
+                "events": [{'body': i, 'type': 'info', 'time': i}]})
+
+        self.assertTrue(accountant.flush(timeout=10))
+        record = accountant.task_log[accountant.index['root']]
+        self.assertEqual(len(record['events']), 1000)
+
+        self.assertTrue(accountant.stop(timeout=10))
+        self.assertFalse(accountant.is_alive())
+        self.assertTrue(accountant.flush(timeout=0))
+
+        # Flushes return if the accountant thread dies
+        accountant = Accountant(root='root')
+        hook = threading.excepthook
+        threading.excepthook = lambda args: None
+        try:
+            result = []
+            accountant.queue.put({"no id": None})
+            waiter = threading.Thread(
+                target=lambda: result.append(accountant.flush()),
+                daemon=True)
+            waiter.start()
+            waiter.join(10)
+            accountant.join(10)
+        finally:
+            threading.excepthook = hook
+        self.assertEqual(result, [True])
+        self.assertTrue(accountant.stopped)
+
+    def test_buffered_reporter(self):
+
+        # No timed flushes, so that the queue size is deterministic
+        accountant = Accountant(root='root')
+        reporter = BufferedReporter(
+            accountant.queue, max_pending=10**6, interval=None)
+
+        for i in range(100):
+            reporter.put({"id": 'root', "data": {'progress': i / 100}})
+        reporter.put({
+            "id": 'root',
+            "events": [{'body': 'event', 'type': 'info', 'time': 1}]})
+        reporter.put({"id": 'root', "children": ['child']})
+        reporter.put({"id": 'child', "data": {'name': 'child'}})
+
+        # Everything coalesces into one message per task id, sent to the
+        # queue as a single batch
+        self.assertEqual(accountant.queue.qsize(), 0)
+        reporter.flush()
+        self.assertEqual(accountant.queue.qsize(), 1)
+
+        tree = accountant.tree(nowait=False)
+        self.assertEqual(tree['progress'], 0.99)
+        self.assertEqual(len(tree['events']), 1)
+        self.assertEqual(tree['children'][0]['name'], 'child')
+
+        accountant.stop()
+
+        # Worker processes flush their buffers when they exit
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(
+            target=buffer_event,
+            args=(BufferedReporter(queue, interval=None),))
+        proc.start()
+        proc.join()
+        self.assertEqual(
+            queue.get(timeout=10),
+            {"id": 'root', "data": {'progress': 1.0}})
+
+    def test_incremental_tree(self):
+
+        accountant = Accountant(root='root')
+        q = accountant.queue
+
+        q.put({"id": 'root', "children": ['a', 'b']})
+        q.put({"id": 'a', "data": {'start_time': 1}})
+        first = accountant.tree(nowait=False)
+        version = accountant.version
+
+        # No changes -> same object
+        self.assertIs(accountant.tree(nowait=False), first)
+        self.assertEqual(accountant.version, version)
+
+        # Change in 'a' -> 'root' and 'a' rebuilt, 'b' reused
+        q.put({"id": 'a', "data": {'end_time': 2}})
+        second = accountant.tree(nowait=False)
+        self.assertGreater(accountant.version, version)
+        self.assertIsNot(second, first)
+        self.assertEqual(second['children'][0]['end_time'], 2)
+        self.assertNotIn('end_time', first['children'][0])
+        self.assertIs(second['children'][1], first['children'][1])
+
+        accountant.stop()
+
+    def test_incremental_order(self):
+
+        accountant = Accountant(root='root')
+        order = OrderedTree()
+        q = accountant.queue
+        rng = random.Random(42)
+
+        ids = ['root']
+        for i in range(300):
+            uid = rng.choice(ids)
+            op = rng.randrange(4)
+            if op == 0:
+                child = 'task-{i}'.format(i=i)
+                ids.append(child)
+                q.put({"id": uid, "children": [child]})
+            elif op == 1:
+                q.put({"id": uid, "data": {'start_time': rng.randrange(50)}})
+            elif op == 2:
+                q.put({"id": uid, "events": [{
+                    'body': i, 'type': 'info', 'time': rng.randrange(50)}]})
+            else:
+                q.put({"id": uid, "data": {'progress': rng.random()}})
+
+            tree = accountant.tree(nowait=False)
+            self.assertEqual(order.update(tree), sorted_tree(tree))
+
+        accountant.stop()
+
+    def test_event_log(self):
+
+        for name in ['log.jsonl', 'log.jsonl.gz']:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, name)
+                accountant = Accountant(root='root', log=path)
+                accountant.queue.put({
+                    "id": 'root',
+                    "data": {'start_time': 100},
+                    "events": [{'body': object(), 'type': 'info', 'time': 1}],
+                    "children": ['child']})
+                accountant.queue.put({"id": 'child', "data": {'name': 'c'}})
+                accountant.stop()
+
+                replayed = TaskTree()
+                for msg in read_log(path):
+                    if "root" in msg:
+                        replayed.root = msg["root"]
+                    else:
+                        replayed.apply(msg)
+
+                tree = replayed.tree()
+                self.assertEqual(tree['id'], 'root')
+                self.assertEqual(tree['start_time'], 100)
+                self.assertIsInstance(tree['events'][0]['body'], str)
+                self.assertEqual(tree['children'][0]['name'], 'c')
+
+    def test_stream_tree(self):
+
+        tree = TaskTree(root='root')
+        tree.apply({
+            "id": 'root',
+            "data": {'start_time': 100},
+            "events": [
+                {'body': 'root event', 'type': 'info', 'time': 102},
+                {'body': 'root error', 'type': 'error', 'time': 100.5}],
+            "children": ['child', 'waiting', 'root']})
+        tree.apply({
+            "id": 'child',
+            "data": {'start_time': 101, 'end_time': 103.25},
+            "events": [{'body': 'child event', 'type': 'info', 'time': 1.5}],
+            "children": []})
+
+        def stream(path, **kwargs):
+            depth, lines = stream_tree(path, **kwargs)
+            return depth, list(lines)
+
+        # Sorted keys (children first), and the layout written by ``save``
+        # (children last, in start order)
+        layouts = [
+            lambda: tree.tree(),
+            lambda: json.loads(json.dumps(tree.view(), default=to_json))]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tree.json')
+            for layout, indent in product(layouts, [None, 4]):
+                with open(path, 'w') as f:
+                    json.dump(
+                        layout(), f, indent=indent,
+                        sort_keys=layout is layouts[0], default=to_json)
+
+                self.assertEqual(
+                    stream(path, chunk_size=5),
+                    (0, ordered_tree(tree.tree())))
+                self.assertEqual(
+                    stream(path, root='child', chunk_size=5),
+                    (1, ordered_tree(tree.tree('child'), indent=1)))
+                self.assertEqual(stream(path, root='missing'), (0, []))
+                self.assertEqual(
+                    [line for _, line in stream(path, types=['error'])[1]
+                     if 'type' in line],
+                    [{'body': 'root error', 'type': 'error'}])
+
+    def test_stream_deep(self):
+
+        # Deeper than the recursion limit; saved layout, so lines are
+        # yielded before the file is fully read (the end is cut off)
+        n = 5000
+        text = ''.join(
+            '{{"id": "t{i}", "start_time": {i}, "events": [{{"type": '
+            '"info", "time": {i}.5, "body": "e{i}"}}], "children": ['
+            .format(i=i) for i in range(n)) + ']}' * (n // 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tree.json')
+            with open(path, 'w') as f:
+                f.write(text)
+
+            depth, lines = stream_tree(path, chunk_size=100)
+            self.assertEqual(depth, 0)
+            received = []
+            with self.assertRaises(ValueError):
+                for line in lines:
+                    received.append(line)
+
+        self.assertEqual(len(received), 2 * n)
+        for i in range(n):
+            self.assertEqual(received[2 * i][0], i)
+            self.assertEqual(received[2 * i][1]['id'], 't{i}'.format(i=i))
+            self.assertEqual(received[2 * i + 1], (i + 1, {
+                'body': 'e{i}'.format(i=i), 'type': 'info'}))
+
+    def test_retention(self):
+
+        from ..viewer import merge_spill, TaskViewer
+
+        with tempfile.TemporaryDirectory() as tmp:
+            spill = os.path.join(tmp, 'spill.jsonl')
+            log = os.path.join(tmp, 'log.jsonl')
+            accountant = Accountant(
+                root='root', max_events=10, spill=spill, log=log)
+            order = OrderedTree()
+            for i in range(500):
+                accountant.queue.put({"id": 'root', "events": [{
+                    'body': 'step {n}'.format(n=i % 7),
+                    'type': 'error' if i % 50 == 0 else 'info',
+                    'time': i}]})
+                if i % 25 == 0:
+                    tree = accountant.tree(nowait=False)
+                    self.assertEqual(order.update(tree), sorted_tree(tree))
+            tree = accountant.tree(nowait=False)
+            accountant.stop()
+
+            # Errors are pinned; the rest is bounded and counted
+            types = [e['type'] for e in tree['events']]
+            self.assertEqual(types.count('error'), 10)
+            self.assertLessEqual(types.count('info'), 10 + 16)
+            self.assertEqual(
+                tree['dropped']['info'] + types.count('info'), 490)
+            self.assertEqual([e['time'] for e in tree['events']][-5:], [
+                495, 496, 497, 498, 499])
+
+            merged = merge_spill(tree, spill)
+            self.assertEqual(
+                [e['time'] for e in merged['events']], list(range(500)))
+            self.assertNotIn('dropped', merged)
+
+            # Event logs already hold every event; the spill is not merged
+            replayed = TaskViewer(log, spill=spill).content
+            self.assertEqual(
+                [e['time'] for e in replayed['events']], list(range(500)))
+            self.assertNotIn('dropped', replayed)
+
+    def test_samples(self):
+
+        tree = TaskTree(root='root', max_samples=100)
+        snapshots = []
+        for i in range(1000):
+            tree.apply({"id": 'root', "samples": [{'time': i}]})
+            snapshots.append(tree.tree()['samples'])
+
+        # Bounded by default; views of earlier snapshots are unchanged
+        record = tree.task_log[tree.index['root']]
+        self.assertLessEqual(len(record['samples']), 125)
+        self.assertEqual(snapshots[-1][-1], {'time': 999})
+        self.assertEqual(list(snapshots[9]), [{'time': i} for i in range(10)])
+        self.assertIs(tree.tree()['samples'], snapshots[-1])
+
+        # The accountant records samples taken by the given sampler
+        with self.assertRaises(ValueError):
+            Accountant(root='root', sample_interval=0.01)
+        accountant = Accountant(
+            root='root', sample_interval=0.01,
+            sampler=lambda: {'time': 0, 'rss': 1})
+        accountant.stop()
+        samples = accountant.tree()['samples']
+        self.assertGreaterEqual(len(samples), 2)
+        self.assertEqual(samples[-1], {'time': 0, 'rss': 1})
+
+    def test_event_memory(self):
+
+        def events(start):
+            return [
+                {'body': 'step', 'type': 'info', 'time': t}
+                for t in range(start, start + 100)]
+
+        tree = TaskTree(root='root')
+        for i in range(200):
+            tree.apply({"id": 'root', "events": events(i * 100)})
+
+        # Snapshots share the event columns instead of holding event dicts
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            for i in range(200, 210):
+                tree.apply({"id": 'root', "events": events(i * 100)})
+                snapshot = tree.tree()
+            growth = tracemalloc.get_traced_memory()[0] - base
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(snapshot['events']), 21000)
+        self.assertEqual(snapshot['events'][-1]['time'], 20999)
+        self.assertLess(growth, 100000)
+
+    def test_ids(self):
+
+        ids = [new_id() for _ in range(1000)]
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertLess(max(len(i) for i in ids), 20)
+
+        # Forked processes get their own prefix
+        if hasattr(os, "fork"):
+            r, w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.write(w, new_id().encode())
+                os._exit(0)
+            os.waitpid(pid, 0)
+            child = os.read(r, 100).decode()
+            os.close(r)
+            os.close(w)
+            self.assertNotEqual(child.split(":")[0], ids[0].split(":")[0])
+
+    def test_transport(self):
+
+        for transport in ["manager", "queue"]:
+            accountant = Accountant(root='root', mp=True, transport=transport)
+            procs = [
+                multiprocessing.Process(
+                    target=send_events, args=(accountant.reporter, i))
+                for i in range(4)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            self.assertEqual(
+                len(accountant.tree(nowait=False)['events']), 400)
+            accountant.stop()
+
+        with self.assertRaises(ValueError):
+            Accountant(root='root', mp=True, transport='pipe')
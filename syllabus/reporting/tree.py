@@ -0,0 +1,335 @@
+"""Incrementally materialized task tree"""
+
+from array import array
+
+from .columns import ValueTable, InternTable, EventColumns, SampleView
+
+
+def _start_order(node):
+    """Sort key of a child, by start time"""
+    start = node.get("start_time")
+    return (start is None, 0 if start is None else start)
+
+
+class TaskTree:
+    """Task tree built incrementally from accountant messages
+
+    Each task has a flat record in ``task_log``, addressed by an integer
+    index; child lists and parent links are stored as arrays of indices. A
+    nested snapshot of every subtree is cached, and only the snapshots on the
+    path from an updated task up to the root are rebuilt. Snapshots are
+    shared between calls and should be treated as read-only.
+
+    Parameters
+    ----------
+    root : str
+        Root node ID
+    max_events : int or None
+        If not None, only the last ``max_events`` events (other than
+        ``pinned`` events) and resource samples of each task are kept in
+        memory; counts of dropped events, by type, are kept in the task's
+        ``dropped``.
+    max_samples : int or None
+        Number of resource samples kept per task if ``max_events`` is None;
+        if None, every sample is kept.
+    pinned : str[]
+        Event types which are never dropped
+    spill : EventLog or None
+        If not None, dropped events and samples are written to this log, as
+        ``{"id": ..., "events": [...]}`` and ``{"id": ..., "samples": [...]}``
+        messages.
+
+    Attributes
+    ----------
+    task_log : dict[]
+        Task records, by index; events are stored in ``EventColumns``, and
+        children as an array of indices.
+    index : dict
+        Index of each task, by ID
+    version : int
+        Incremented every time an update is applied; readers can skip work if
+        the version has not changed.
+    """
+
+    def __init__(
+            self, root=None, max_events=None, pinned=("error", "warning"),
+            spill=None, max_samples=3600):
+
+        self.task_log = []
+        self.index = {}
+        self.root = root
+        self.version = 0
+
+        self.max_events = max_events
+        self.max_samples = max_samples
+        self.pinned = frozenset(pinned)
+        self.spill = spill
+
+        # Event types and bodies, interned for all tasks
+        self.__types = ValueTable()
+        self.__bodies = InternTable()
+
+        # Parent links (-1 if none) for the spanning tree used in snapshots,
+        # and positions in the parent's child list; a task listed as a child
+        # of more than one task (or of its own descendant) is only linked to
+        # the first, and is shown as a stub {"id": ...} elsewhere.
+        self.__parent = array('l')
+        self.__position = array('l')
+
+        # Up-to-date snapshots, and outdated snapshots with the set of
+        # linked children that have changed since, by index
+        self.__cache = {}
+        self.__stale = {}
+
+        # (total, evictions) of each task's events at its last snapshot
+        self.__marks = []
+
+    def __add_new(self, uid):
+        """Get the index of a task, adding a blank task if needed"""
+        i = self.index.get(uid)
+        if i is None:
+            i = len(self.task_log)
+            self.index[uid] = i
+            self.task_log.append({
+                "events": EventColumns(
+                    self.__types, self.__bodies, limit=self.max_events,
+                    pinned=self.pinned),
+                "children": array('L'), "id": uid})
+            self.__parent.append(-1)
+            self.__position.append(0)
+            self.__marks.append(None)
+        return i
+
+    def __invalidate(self, i):
+        """Mark the snapshots of a task and its ancestors as outdated
+
+        A snapshot is only cached if the snapshots of all of its children are,
+        so the walk stops at the first ancestor that is already outdated.
+        """
+
+        child = -1
+        while i >= 0:
+            snapshot = self.__cache.pop(i, None)
+            if snapshot is not None:
+                self.__stale[i] = (snapshot, set())
+            if child >= 0 and i in self.__stale:
+                self.__stale[i][1].add(child)
+            if snapshot is None:
+                break
+            child, i = i, self.__parent[i]
+
+    def __is_ancestor(self, i, node):
+        """Check if task i is node or one of its (linked) ancestors"""
+        while node >= 0:
+            if node == i:
+                return True
+            node = self.__parent[node]
+        return False
+
+    def apply(self, update):
+        """Apply a single update
+
+        Parameters
+        ----------
+        update : dict
+            Queue message with "id" and optional "data", "events",
+            "children" and "samples" (resource samples, see
+            ``profiling.sample``) fields
+        """
+
+        uid = update["id"]
+        if self.root is None:
+            self.root = uid
+
+        i = self.__add_new(uid)
+        record = self.task_log[i]
+        # Refer to the stored ID, so that the copies in every message (for
+        # example from other processes) are not kept
+        uid = record["id"]
+
+        if "data" in update:
+            record.update(update["data"])
+        if "events" in update:
+            events = record["events"]
+            evicted = []
+            for event in update["events"]:
+                evicted += events.append(event)
+            if evicted and self.spill is not None:
+                self.spill.write([{"id": uid, "events": evicted}])
+        if "samples" in update:
+            samples = record.setdefault("samples", [])
+            samples += update["samples"]
+            limit = (
+                self.max_samples if self.max_events is None
+                else self.max_events)
+            if limit is not None and (
+                    len(samples) > limit + max(16, limit // 4)):
+                self.__drop_samples(i, samples, limit)
+        if "children" in update:
+            for child in update["children"]:
+                c = self.__add_new(child)
+                if (
+                        self.__parent[c] < 0 and
+                        child != self.root and
+                        not self.__is_ancestor(c, i)):
+                    self.__parent[c] = i
+                    self.__position[c] = len(record["children"])
+                record["children"].append(c)
+
+        self.__invalidate(i)
+        self.version += 1
+
+    def __drop_samples(self, i, samples, limit):
+        """Drop the oldest samples of a task beyond limit
+
+        The list is replaced instead of modified in place, so that sample
+        views of previous snapshots stay valid.
+        """
+        record = self.task_log[i]
+        excess = len(samples) - limit
+        if self.spill is not None:
+            self.spill.write(
+                [{"id": record["id"], "samples": samples[:excess]}])
+        record["samples"] = samples[excess:]
+
+    def __linked(self, i, idx, child):
+        """Check if the child at position idx of task i is linked to it"""
+        return self.__parent[child] == i and self.__position[child] == idx
+
+    def __child(self, i, idx, child):
+        """Snapshot of the child at position idx of task i"""
+        if self.__linked(i, idx, child):
+            return self.__snapshot(child)
+        else:
+            return {"id": self.task_log[child]["id"]}
+
+    def __snapshot(self, i):
+        """Get (possibly cached) nested snapshot of a linked subtree
+
+        Outdated snapshots are rebuilt by copying the previous child list and
+        replacing only the children that have changed.
+        """
+
+        cached = self.__cache.get(i)
+        if cached is not None:
+            return cached
+
+        record = self.task_log[i]
+        old, changed = self.__stale.pop(i, (None, ()))
+
+        snapshot = {}
+        for k, v in record.items():
+            if k == "children":
+                if old is None:
+                    children = [
+                        self.__child(i, j, c) for j, c in enumerate(v)]
+                else:
+                    children = list(old["children"])
+                    for c in changed:
+                        children[self.__position[c]] = self.__snapshot(c)
+                    children += [
+                        self.__child(i, j, v[j])
+                        for j in range(len(children), len(v))]
+                snapshot[k] = children
+            elif k == "events":
+                # Views share the columns, so no events are copied
+                mark = (v.total, v.evictions)
+                if old is not None and self.__marks[i] == mark:
+                    snapshot[k] = old[k]
+                else:
+                    snapshot[k] = v.view()
+                self.__marks[i] = mark
+                if v.dropped:
+                    snapshot["dropped"] = dict(v.dropped)
+            elif k == "samples":
+                prev = None if old is None else old.get(k)
+                if prev is not None and prev.origin is v and (
+                        len(prev) == len(v)):
+                    snapshot[k] = prev
+                else:
+                    snapshot[k] = SampleView(v, len(v))
+            else:
+                snapshot[k] = v
+
+        self.__cache[i] = snapshot
+        return snapshot
+
+    def tree(self, root=None):
+        """Get task tree as dict
+
+        Parameters
+        ----------
+        root : str or None
+            Root node ID; if None, the program root is used.
+
+        Returns
+        -------
+        dict
+            Dictionary representation of task tree. Events are ``EventView``
+            sequences, which build event dicts as they are read (use
+            ``json.dump`` with ``default=columns.to_json``). Unchanged
+            subtrees are returned as the same objects as in previous calls.
+        """
+
+        if root is None:
+            if self.root is None:
+                return {}
+            root = self.root
+
+        i = self.index.get(root)
+        if i is None:
+            return {"id": root}
+        return self.__snapshot(i)
+
+    def __view(self, i):
+        """Uncached nested view of a linked subtree"""
+
+        record = self.task_log[i]
+        view = {}
+        for k, v in record.items():
+            if k == "samples":
+                view[k] = SampleView(v, len(v))
+            elif k != "children" and k != "events":
+                view[k] = v
+
+        events = record["events"]
+        if events.dropped:
+            view["dropped"] = dict(events.dropped)
+        view["events"] = events.view()
+
+        children = [
+            self.__view(c) if self.__linked(i, j, c)
+            else {"id": self.task_log[c]["id"]}
+            for j, c in enumerate(record["children"])]
+        children.sort(key=_start_order)
+        view["children"] = children
+        return view
+
+    def view(self, root=None):
+        """Get task tree as dict, without caching snapshots
+
+        Same structure as ``tree``; use for one-off exports, which do not
+        need to reuse unchanged subtrees. The keys of each task are ordered
+        for ``stream_tree``: task fields, then events, then children, which
+        are sorted by start time (children that have not started last).
+
+        Parameters
+        ----------
+        root : str or None
+            Root node ID; if None, the program root is used.
+
+        Returns
+        -------
+        dict
+            Dictionary representation of task tree
+        """
+
+        if root is None:
+            if self.root is None:
+                return {}
+            root = self.root
+
+        i = self.index.get(root)
+        if i is None:
+            return {"id": root}
+        return self.__view(i)
@@ -1,15 +1,32 @@
 
 """Task Class"""
 
-import sys
 import time
 
 from .format import size_fmt, time_fmt
+from .profiling import deep_sizeof, Usage, sample
 from .reporting import ReporterMixin
 from .parallel import ParallelMixin
 
 
 class Task(ReporterMixin, ParallelMixin):
+    """Task tracker
+
+    Parameters
+    ----------
+    *args, **kwargs
+        Passed on to ReporterMixin (name, desc, root, reporter, mp, log,
+        profile, sample_interval, max_events, pinned, spill, transport,
+        asynchronous, sampler); resource samples are taken with
+        ``profiling.sample`` unless another ``sampler`` is given.
+    pools : PoolManager or None
+        Worker pools; subtasks share the pools of their root task.
+    """
+
+    def __init__(self, *args, pools=None, **kwargs):
+        kwargs.setdefault("sampler", sample)
+        ReporterMixin.__init__(self, *args, **kwargs)
+        ParallelMixin.__init__(self, pools=pools)
 
     def __update_name(self, name=None, desc=None):
         """Update task name and/or description
@@ -43,6 +60,8 @@ class Task(ReporterMixin, ParallelMixin):
         """
 
         self.__update_name(name=name, desc=desc)
+        if self.profile:
+            self.__usage = Usage().start()
         self.start_time = time.time()
         self.update_metadata("start_time", "name", "desc")
 
@@ -54,8 +73,9 @@ class Task(ReporterMixin, ParallelMixin):
         Parameters
         ----------
         *objects : list of arbitrary objects
-            The size of the objects in 'objects' is computed and used to
-            report the task's memory footprint
+            The deep size of the objects in 'objects' (see
+            ``profiling.deep_sizeof``) is computed and used to report the
+            task's memory footprint
         name : str or None
             Name to set
         desc : str or None
@@ -63,16 +83,38 @@ class Task(ReporterMixin, ParallelMixin):
             reflect the status -- 'loading images' -> 'loaded images')
         """
 
-        self.size = sum(sys.getsizeof(obj) for obj in objects)
+        self.size = deep_sizeof(*objects) if objects else 0
 
         self.__update_name(name=name, desc=desc)
         self.end_time = time.time()
         self.update_metadata("size", "end_time", "name", "desc")
+        if self.profile and self.start_time is not None:
+            self.usage = self.__usage.stop()
+            self.update_metadata("usage")
+        self.reporter.flush()
 
         if self.root:
+            self.pools.shutdown()
             self.system_root("Main task finished.")
             self.accountant.stop(nowait)
 
+    async def __aenter__(self):
+        """Start the task in an ``async with`` block
+
+        The block's event loop is attached to the root task's accountant, if
+        it is asynchronous (see ``attach_loop``).
+        """
+        self.attach_loop()
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Mark the task as done; an exception raised in the block is
+        reported as an error (and not suppressed)"""
+        if isinstance(exc, Exception):
+            self.error("{n}: {e}".format(n=type(exc).__name__, e=exc))
+        self.done()
+        return False
+
     def subtask(self, name='Child Task', desc=None):
         """Create a subtask
 
@@ -94,7 +136,9 @@ class Task(ReporterMixin, ParallelMixin):
             desc=desc,
             reporter=self.reporter,
             root=False,
-            mp=self.mp)
+            mp=self.mp,
+            profile=self.profile,
+            pools=self.pools)
         self.children[new_task.id] = new_task
 
         self.reporter.put({
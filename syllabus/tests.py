@@ -15,6 +15,7 @@ This file will recursively search all imported modules for
 """
 
 import os
+import sys
 import unittest
 from types import ModuleType
 
@@ -71,10 +72,19 @@ def run_tests(modules):
 
 if __name__ == "__main__":
 
-    from reporting import tests
+    # Import the tests through the package, so that they can use relative
+    # imports across subpackages
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+    from syllabus.reporting import tests as reporting_tests
+    from syllabus.parallel import tests as parallel_tests
+    from syllabus.profiling import tests as profiling_tests
+    from syllabus.app_utils import tests as app_utils_tests
     # Add more modules here
     # Ex.
     # import foo
     # import bar
 
-    run_tests([tests])
+    run_tests([
+        reporting_tests, parallel_tests, profiling_tests, app_utils_tests])
@@ -1,7 +1,9 @@
 """Viewer for saved JSON logs"""
 
-from .reporting import ordered_tree
+from .reporting import (
+    ordered_tree, TaskTree, read_log, is_event_log, stream_tree)
 from .format import format_line
+from .format.utils import INDENT
 import json
 import re
 
@@ -11,35 +13,209 @@ def clear_esc(text):
     return re.sub(r'\x1B\[[0-?]*[ -/]*[@-~]', '', text)
 
 
+def replay_log(file, types=None):
+    """Rebuild a task tree from a JSONL event log
+
+    Parameters
+    ----------
+    file : str
+        Event log written by ``Accountant(log=...)``
+    types : str[] or None
+        If not None, only events of these types are kept.
+
+    Returns
+    -------
+    TaskTree
+        Task tree with all messages in the log applied
+    """
+
+    if types is not None:
+        types = set(types)
+
+    tree = TaskTree()
+    for msg in read_log(file):
+        if "root" in msg:
+            tree.root = msg["root"]
+            continue
+        if types is not None and "events" in msg:
+            msg["events"] = [e for e in msg["events"] if e["type"] in types]
+        tree.apply(msg)
+    return tree
+
+
+def merge_spill(tree, file, types=None):
+    """Merge dropped events back into a task tree
+
+    Parameters
+    ----------
+    tree : dict
+        Task tree (saved, or replayed from an event log) of a root task with
+        ``max_events`` set
+    file : str
+        Spill log written by that task (``spill=...``)
+    types : str[] or None
+        If not None, only events of these types are kept.
+
+    Returns
+    -------
+    dict
+        New task tree, with spilled events and samples added back in time
+        order, and dropped counts reduced accordingly
+    """
+
+    events = {}
+    samples = {}
+    for msg in read_log(file):
+        if "events" in msg:
+            events.setdefault(msg["id"], []).extend(msg["events"])
+        if "samples" in msg:
+            samples.setdefault(msg["id"], []).extend(msg["samples"])
+
+    def merge(node):
+        if "children" not in node:
+            return node
+        node = dict(node)
+        uid = node.get("id")
+
+        spilled = events.get(uid, [])
+        merged = sorted(
+            spilled + list(node.get("events", [])), key=lambda e: e["time"])
+        if types is not None:
+            merged = [e for e in merged if e["type"] in types]
+        node["events"] = merged
+
+        if spilled and node.get("dropped"):
+            dropped = dict(node["dropped"])
+            for e in spilled:
+                dropped[e["type"]] = dropped.get(e["type"], 0) - 1
+            dropped = {k: v for k, v in dropped.items() if v > 0}
+            if dropped:
+                node["dropped"] = dropped
+            else:
+                del node["dropped"]
+
+        if uid in samples:
+            node["samples"] = samples[uid] + list(node.get("samples", []))
+        node["children"] = [merge(c) for c in node["children"]]
+        return node
+
+    return merge(tree)
+
+
+def find_subtree(tree, uid):
+    """Find the (non-stub) subtree of a task
+
+    Returns
+    -------
+    dict
+        Subtree; ``{"id": uid}`` if not found
+    """
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.get("id") == uid and "children" in node:
+            return node
+        stack += node.get("children", [])
+    return {"id": uid}
+
+
 class TaskViewer():
     """Viewer for saved JSON logs
 
+    Files are parsed lazily: ``lines``, ``print`` and ``save`` stream the
+    file, keeping only formatted output lines in memory, while ``content``
+    loads the full tree as a dict.
+
     Parameters
     ----------
     file : str
-        File to open
+        File to open; either a JSON tree saved by ``Task.save``, or a JSONL
+        event log ('.jsonl' or '.jsonl.gz') written with ``log=...``.
+    root : str or None
+        If not None, only show the subtree with this task ID.
+    types : str[] or None
+        If not None, only show events of these types (for example
+        ``["error", "warning"]``).
+    spill : str or None
+        Spill log of dropped events, written with ``spill=...``; if not None,
+        dropped events are merged back into a saved tree (which is then
+        loaded in memory instead of streamed). Ignored for event logs, which
+        already contain every event.
     """
 
-    def __init__(self, file):
+    def __init__(self, file, root=None, types=None, spill=None):
 
         self.file = file
-        with open(file) as f:
-            self.content = json.loads(f.read())
+        self.root = root
+        self.types = types
+        self.spill = None if is_event_log(file) else spill
+        self.__content = None
+
+    @property
+    def content(self):
+        """Full task tree, as a dict (loaded on first access)"""
+
+        if self.__content is None:
+            self.__content = self.__load()
+            if self.spill is not None:
+                self.__content = merge_spill(self.__content, self.spill)
+        return self.__content
+
+    def __load(self):
+        """Load the full task tree"""
+        if is_event_log(self.file):
+            return replay_log(self.file).tree()
+        with open(self.file) as f:
+            return json.load(f)
+
+    def lines(self):
+        """Generate formatted lines
+
+        Yields
+        ------
+        str
+            Formatted line, in the same format as ``BasicTaskApp``
+        """
+
+        if self.spill is not None:
+            if self.types is None:
+                tree = self.content
+            else:
+                tree = merge_spill(
+                    self.__load(), self.spill, types=set(self.types))
+            if self.root is not None:
+                tree = find_subtree(tree, self.root)
+            for line in ordered_tree(tree):
+                yield format_line(line)
+        elif is_event_log(self.file):
+            tree = replay_log(self.file, types=self.types).tree(self.root)
+            for line in ordered_tree(tree):
+                yield format_line(line)
+        else:
+            depth, lines = stream_tree(
+                self.file, fmt=format_line, types=self.types, root=self.root)
+            # Subtrees are formatted at their original indentation
+            strip = len(INDENT) * depth
+            for line in lines:
+                yield line[strip:]
 
     def __str__(self):
         """Get string representation"""
-        return '\n'.join([
-            format_line(line)
-            for line in ordered_tree(self.content)])
+        return '\n'.join(self.lines())
 
     def print(self):
         """Print formatted log"""
-        print(self.__str__())
+        for line in self.lines():
+            print(line)
         return self
 
     def save(self, file, color=False):
         """Save log to file
 
+        Lines are written as they are generated, without building the full
+        output string.
+
         Parameters
         ----------
         file : str
@@ -48,8 +224,8 @@ class TaskViewer():
             If False, ANSI escape sequences are stripped before saving.
         """
         with open(file, 'w') as f:
-            if color:
-                f.write(self.__str__())
-            else:
-                f.write(clear_esc(self.__str__()))
+            for i, line in enumerate(self.lines()):
+                if i > 0:
+                    f.write('\n')
+                f.write(line if color else clear_esc(line))
         return self